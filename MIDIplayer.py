@@ -1,29 +1,43 @@
 # plays MIDI files at specified BPM with actual audio output (Fixed version without FluidSynth)
-import mido
+import argparse
 from mido import MidiFile, MidiTrack, MetaMessage
-import time
-import threading
 import os
 import pygame
 import sys
 
+from midi_index import MidiIndex, DEFAULT_INDEX_PATH, parse_pitch
+from midi_stream import MidiStream
+from playback_engine import PlaybackEngine, PygameMidiSink, NullSink
+from realtime_synth import (RealtimeSynth, open_audio_output, DEFAULT_SAMPLE_RATE, DEFAULT_BLOCK_SIZE,
+                            DEFAULT_MAX_VOICES, STEAL_POLICIES)
+from soundfont import SoundFont, SoundFontError
+
+# (path, mtime_ns, size) -> (tempo_map, end_tick); lets reloading a file skip the timing pass
+_timing_cache = {}
+
 class MIDIPlayer:
-    def __init__(self):
+    def __init__(self, soundfont_path=None, audio_output='auto', max_voices=DEFAULT_MAX_VOICES, steal='oldest'):
         self.midi_data = None
         self.original_bpm = 120
         self.current_bpm = 120
         self.is_playing = False
         self.is_paused = False
-        self.play_thread = None
-        self.start_time = 0
-        self.pause_time = 0
-        self.current_position = 0
+        self._position = 0
         self.current_file_path = None
         self.duration = 0
+        self.tempo_map = None
+        self.end_tick = 0
+        self.engine = None
+        self.synth = None
+        self.audio_output = None
         
-        # Initialize pygame mixer for audio playback
+        # Initialize pygame mixer for audio playback (small blocks when synthesizing)
         try:
-            pygame.mixer.pre_init(frequency=22050, size=-16, channels=2, buffer=1024)
+            if soundfont_path:
+                pygame.mixer.pre_init(frequency=DEFAULT_SAMPLE_RATE, size=-16, channels=2,
+                                      buffer=DEFAULT_BLOCK_SIZE)
+            else:
+                pygame.mixer.pre_init(frequency=22050, size=-16, channels=2, buffer=1024)
             pygame.mixer.init()
             self.audio_enabled = True
             print("Audio system initialized successfully.")
@@ -32,6 +46,49 @@ class MIDIPlayer:
             print("Will run in silent mode (console output only).")
             self.audio_enabled = False
         
+        # With a SoundFont, synthesize in-process: the engine feeds the synth and
+        # the audio output pulls fixed-size blocks from it.
+        if soundfont_path:
+            self._start_synth(soundfont_path, audio_output, max_voices, steal)
+            if self.synth:
+                self.midi_sink = self.synth
+                return
+        
+        # Prefer streaming events to a MIDI output so BPM changes are audible;
+        # otherwise fall back to pygame.mixer.music at the file's own tempo.
+        try:
+            self.midi_sink = PygameMidiSink()
+            print("MIDI output opened: tempo changes apply live.")
+        except (RuntimeError, pygame.error) as e:
+            self.midi_sink = None
+            if self.audio_enabled:
+                print(f"Note: no MIDI output device ({e}); audio plays at the original tempo.")
+    
+    def _start_synth(self, soundfont_path, audio_output, max_voices, steal):
+        """Load the SoundFont and open a block-based audio output for it."""
+        try:
+            soundfont = SoundFont(soundfont_path)
+        except (OSError, SoundFontError) as e:
+            print(f"Warning: could not load SoundFont {soundfont_path}: {e}")
+            return
+        self.synth = RealtimeSynth(soundfont, max_voices=max_voices, steal=steal)
+        if not self.audio_enabled and audio_output in ('auto', 'pygame'):
+            audio_output = 'null'
+        self.audio_output = open_audio_output(self.synth, audio_output)
+        self.audio_output.start()
+        print(f"Synth ready ({self.audio_output.name} output, {max_voices} voices, "
+              f"{self.synth.output_latency * 1000:.1f} ms buffer latency).")
+    
+    def close(self):
+        """Stop playback and release the audio output and MIDI device."""
+        self.stop()
+        if self.audio_output:
+            self.audio_output.stop()
+            self.audio_output = None
+        if self.midi_sink:
+            self.midi_sink.close()
+            self.midi_sink = None
+        
     def load_midi_file(self, file_path):
         """Load a MIDI file and extract tempo information."""
         try:
@@ -41,8 +98,16 @@ class MIDIPlayer:
             # Store the file path for pygame playback
             self.current_file_path = file_path
             
-            # Load with mido
-            self.midi_data = mido.MidiFile(file_path)
+            # Map the file; events are decoded lazily track by track
+            if self.engine:
+                self.engine.stop()
+            if self.midi_data:
+                self.midi_data.close()
+                self.midi_data = None
+            self.midi_data = MidiStream(file_path)
+            
+            # Merged tempo map + end of song, computed once per file version
+            self.tempo_map, self.end_tick = self._load_timing(file_path)
             
             # Get original tempo (BPM) from MIDI file
             self.original_bpm = self._extract_bpm_from_midi()
@@ -51,6 +116,14 @@ class MIDIPlayer:
             # Calculate duration
             self.duration = self._calculate_duration()
             
+            # Merge and time every channel message in one streaming pass
+            self.engine = PlaybackEngine.from_stream(
+                self.midi_data, sink=self.midi_sink or NullSink(), end_seconds=self.duration)
+            if self.synth:
+                # Page in every sample the file needs now, not inside the audio callback
+                self.synth.prepare(zip(self.engine.status, self.engine.data1, self.engine.data2))
+            self.engine.on_finished = self._on_playback_finished
+            
             print(f"Loaded MIDI file: {file_path}")
             print(f"Original BPM: {self.original_bpm}")
             print(f"Duration: {self.duration:.2f} seconds")
@@ -60,38 +133,58 @@ class MIDIPlayer:
             print(f"Error loading MIDI file: {e}")
             return False
     
+    def _load_timing(self, file_path):
+        """Build (or reuse) the tempo map and last tick for the loaded file in one pass."""
+        stat = os.stat(file_path)
+        cache_key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        if cache_key in _timing_cache:
+            return _timing_cache[cache_key]
+        
+        tempo_map, end_tick = self.midi_data.scan_timing()
+        _timing_cache[cache_key] = (tempo_map, end_tick)
+        return tempo_map, end_tick
+    
     def _extract_bpm_from_midi(self):
-        """Extract BPM from MIDI file using mido."""
-        for track in self.midi_data.tracks:
-            for msg in track:
-                if msg.type == 'set_tempo':
-                    # Convert microseconds per beat to BPM
-                    return 60000000 / msg.tempo
-        return 120  # Default BPM if no tempo found
+        """BPM at the start of the file (120 if it has no set_tempo)."""
+        if self.tempo_map is None:
+            return 120
+        return self.tempo_map.bpm_at(0)
     
     def _calculate_duration(self):
-        """Calculate the duration of the MIDI file in seconds."""
-        if not self.midi_data:
+        """Calculate the duration of the MIDI file in seconds, following every tempo change."""
+        if not self.midi_data or self.tempo_map is None:
             return 0
-        
-        total_ticks = 0
-        for track in self.midi_data.tracks:
-            track_ticks = sum(msg.time for msg in track)
-            total_ticks = max(total_ticks, track_ticks)
-        
-        # Convert ticks to seconds using ticks_per_beat and BPM
-        ticks_per_beat = self.midi_data.ticks_per_beat
-        beats_per_second = self.original_bpm / 60
-        ticks_per_second = ticks_per_beat * beats_per_second
-        
-        return total_ticks / ticks_per_second if ticks_per_second > 0 else 0
+        return self.tempo_map.tick_to_seconds(self.end_tick)
+    
+    def tick_to_seconds(self, tick):
+        """Original-tempo time in seconds of a tick in the loaded file."""
+        return self.tempo_map.tick_to_seconds(tick) if self.tempo_map else 0
+    
+    def seconds_to_tick(self, seconds):
+        """Tick reached at `seconds` of original-tempo time in the loaded file."""
+        return self.tempo_map.seconds_to_tick(seconds) if self.tempo_map else 0
     
     def set_bpm(self, bpm):
         """Set the playback BPM."""
         if bpm <= 0:
             raise ValueError("BPM must be positive")
         self.current_bpm = bpm
+        if self.engine:
+            self.engine.set_rate(self.current_bpm / self.original_bpm)
         print(f"BPM set to: {bpm}")
+        if self.is_playing and self.midi_sink is None and self.audio_enabled:
+            print("Note: without a MIDI output device the audio stays at the original tempo.")
+    
+    @property
+    def current_position(self):
+        """Playback position in seconds at the current BPM, computed on demand."""
+        if self.is_playing and self.engine:
+            return self.engine.position() * self.get_tempo_ratio()
+        return self._position
+    
+    @current_position.setter
+    def current_position(self, value):
+        self._position = value
     
     def get_tempo_ratio(self):
         """Calculate the tempo ratio between original and current BPM."""
@@ -133,47 +226,31 @@ class MIDIPlayer:
         self.is_playing = True
         self.is_paused = False
         self.current_position = start_time
-        self.start_time = time.time() - start_time
         
-        # If we have the original file path, try pygame playback
-        if hasattr(self, 'current_file_path') and self.current_file_path and self.audio_enabled:
-            self.play_with_pygame(self.current_file_path)
+        # Engine works in original-tempo seconds; positions here are at current BPM
+        self.engine.set_rate(self.current_bpm / self.original_bpm)
+        self.engine.play(start_time / self.get_tempo_ratio())
         
-        # Start timing thread for position tracking
-        self.play_thread = threading.Thread(target=self._play_worker, daemon=True)
-        self.play_thread.start()
+        # Without a MIDI output, let pygame render the file itself
+        if self.midi_sink is None and self.current_file_path and self.audio_enabled:
+            self.play_with_pygame(self.current_file_path)
         
         print(f"Playing MIDI at {self.current_bpm} BPM...")
         return True
     
-    def _play_worker(self):
-        """Worker thread for tracking playback position."""
-        if self.midi_data is None:
-            return
-            
-        tempo_ratio = self.get_tempo_ratio()
-        total_duration = self.duration * tempo_ratio
-        
-        while self.is_playing:
-            if not self.is_paused:
-                # Update current position
-                current_time = time.time() - self.start_time
-                self.current_position = current_time
-                
-                # Check if we've reached the end
-                if self.current_position >= total_duration:
-                    print("♪ Playback finished.")
-                    self.is_playing = False
-                    break
-            
-            time.sleep(0.1)  # Update every 100ms
+    def _on_playback_finished(self):
+        """Called by the engine's scheduler thread when the last event has played."""
+        self._position = self.engine.position() * self.get_tempo_ratio()
+        self.is_playing = False
+        self.is_paused = False
+        print("♪ Playback finished.")
     
     def pause(self):
         """Pause playback."""
         if self.is_playing and not self.is_paused:
             self.is_paused = True
-            self.pause_time = time.time()
-            if self.audio_enabled:
+            self.engine.pause()
+            if self.midi_sink is None and self.audio_enabled:
                 pygame.mixer.music.pause()
             print("Playback paused.")
             return True
@@ -182,11 +259,9 @@ class MIDIPlayer:
     def resume(self):
         """Resume playback."""
         if self.is_playing and self.is_paused:
-            # Adjust start time to account for pause duration
-            pause_duration = time.time() - self.pause_time
-            self.start_time += pause_duration
             self.is_paused = False
-            if self.audio_enabled:
+            self.engine.resume()
+            if self.midi_sink is None and self.audio_enabled:
                 pygame.mixer.music.unpause()
             print("Playback resumed.")
             return True
@@ -199,12 +274,10 @@ class MIDIPlayer:
             self.is_paused = False
             self.current_position = 0
             
-            # Stop pygame audio
+            # Stop the event stream and pygame audio
+            self.engine.stop()
             self.stop_pygame()
             
-            if self.play_thread and self.play_thread.is_alive():
-                self.play_thread.join(timeout=1)
-            
             print("Playback stopped.")
             return True
         return False
@@ -220,6 +293,11 @@ class MIDIPlayer:
             'audio_enabled': self.audio_enabled
         }
         
+        if self.synth:
+            average, worst = self.synth.latency_report()
+            status['latency_ms'] = (average * 1000, worst * 1000)
+            status['voices'] = self.synth.active_voice_count()
+        
         if self.midi_data:
             status['duration'] = self.duration * self.get_tempo_ratio()
             status['file_loaded'] = True
@@ -242,12 +320,14 @@ class MIDIPlayer:
             print(f"Position must be between 0 and {max_duration:.2f} seconds.")
             return False
         
-        was_playing = self.is_playing
-        if was_playing:
-            self.stop()
-        
-        if was_playing:
-            self.play(start_time=position)
+        if self.is_playing:
+            # Jump inside the running engine; no stop/restart of thread or device
+            self.engine.seek(position / self.get_tempo_ratio())
+            if self.midi_sink is None and self.audio_enabled:
+                try:
+                    pygame.mixer.music.set_pos(position / self.get_tempo_ratio())
+                except pygame.error:
+                    print("Note: the fallback audio cannot seek; only the position moved.")
         else:
             self.current_position = position
         
@@ -255,23 +335,60 @@ class MIDIPlayer:
         return True
 
 
+def _list_midi_files(**filters):
+    """Index the current directory (only new or changed files are scanned) and query it."""
+    with MidiIndex(DEFAULT_INDEX_PATH) as library:
+        library.refresh('.', recursive=False)
+        rows = library.query('.', recursive=False, **filters)
+    return [(os.path.basename(path), bpm, duration) for path, bpm, duration, _, _ in rows]
+
+
 def select_midi_file():
     """Allow user to select a MIDI file from available options."""
-    # Look for MIDI files in the current directory
-    midi_files = [f for f in os.listdir('.') if f.endswith('.mid') or f.endswith('.midi')]
+    # Look for MIDI files in the current directory, with BPM and length from the index
+    listing = _list_midi_files()
+    midi_files = [name for name, _, _ in listing]
     
     if not midi_files:
         print("No MIDI files found in current directory.")
         return None
     
-    print("\nAvailable MIDI files:")
-    for i, file in enumerate(midi_files, 1):
-        print(f"{i}. {file}")
+    def show(listing):
+        print("\nAvailable MIDI files:")
+        for i, (file, bpm, duration) in enumerate(listing, 1):
+            details = f"  ({bpm:.0f} BPM, {duration:.0f}s)" if bpm is not None else ""
+            print(f"{i}. {file}{details}")
+    
+    show(listing)
+    print("(filter with 'bpm <min>-<max>' or 'program <n> [above <pitch>]'; 'all' lists everything again)")
     
     while True:
         try:
             choice = input(f"\nSelect a file (1-{len(midi_files)}) or enter filename: ").strip()
             
+            # Filter the list from the index
+            words = choice.lower().split()
+            if words and words[0] in ('bpm', 'program', 'all'):
+                try:
+                    if words[0] == 'bpm':
+                        low, high = (float(value) for value in words[1].split('-'))
+                        filtered = _list_midi_files(min_bpm=low, max_bpm=high)
+                    elif words[0] == 'program':
+                        above = parse_pitch(words[3]) if len(words) > 3 and words[2] == 'above' else None
+                        filtered = _list_midi_files(program=int(words[1]), pitch_above=above)
+                    else:
+                        filtered = _list_midi_files()
+                except (IndexError, ValueError):
+                    print("Usage: bpm <min>-<max> | program <n> [above <pitch>] | all")
+                    continue
+                if filtered:
+                    listing = filtered
+                    midi_files = [name for name, _, _ in listing]
+                    show(listing)
+                else:
+                    print("No files match that filter.")
+                continue
+            
             # Check if it's a number
             if choice.isdigit():
                 index = int(choice) - 1
@@ -298,9 +415,19 @@ def select_midi_file():
             return None
 
 
-def main():
+def main(argv=None):
     """Enhanced MIDI Player with file selection."""
-    player = MIDIPlayer()
+    parser = argparse.ArgumentParser(description="Interactive MIDI player")
+    parser.add_argument('--soundfont', help="Synthesize in-process with this .sf2 (low-latency block output)")
+    parser.add_argument('--output', default='auto', choices=['auto', 'sounddevice', 'pygame', 'null'],
+                        help="Audio output used with --soundfont")
+    parser.add_argument('--polyphony', type=int, default=DEFAULT_MAX_VOICES,
+                        help="Maximum simultaneous synth voices (bounds CPU per audio block)")
+    parser.add_argument('--steal', default='oldest', choices=STEAL_POLICIES,
+                        help="Which voice to cut when the polyphony limit is reached")
+    args = parser.parse_args(argv)
+    player = MIDIPlayer(soundfont_path=args.soundfont, audio_output=args.output,
+                        max_voices=args.polyphony, steal=args.steal)
     
     print("🎵 Enhanced MIDI Player (FluidSynth-Free) 🎵")
     print("=" * 45)
@@ -317,6 +444,7 @@ def main():
         print("p - play/pause")
         print("s - stop")
         print("b <bpm> - set BPM (e.g., 'b 140')")
+        print("j <seconds> - jump to position (e.g., 'j 30')")
         print("t - show status")
         print("f - select different file")
         print("q - quit")
@@ -326,7 +454,7 @@ def main():
                 command = input("\n♪ Enter command: ").strip().lower()
                 
                 if command == 'q':
-                    player.stop()
+                    player.close()
                     break
                 elif command == 'p':
                     if player.is_playing:
@@ -342,10 +470,13 @@ def main():
                     try:
                         bpm = float(command.split()[1])
                         player.set_bpm(bpm)
-                        if player.is_playing:
-                            print("Note: BPM change will take effect on next play.")
                     except (IndexError, ValueError):
                         print("Usage: b <bpm> (e.g., b 140)")
+                elif command.startswith('j '):
+                    try:
+                        player.seek(float(command.split()[1]))
+                    except (IndexError, ValueError):
+                        print("Usage: j <seconds> (e.g., j 30)")
                 elif command == 't':
                     status = player.get_status()
                     print(f"\n📊 Status:")
@@ -356,6 +487,9 @@ def main():
                     print(f"Position: {status['current_position']:.1f}s / {status['duration']:.1f}s")
                     print(f"BPM: {status['current_bpm']} (original: {status['original_bpm']})")
                     print(f"Audio: {'Enabled' if status['audio_enabled'] else 'Disabled'}")
+                    if 'latency_ms' in status:
+                        print(f"Synth: {status['voices']} voices, latency "
+                              f"{status['latency_ms'][0]:.1f} ms avg / {status['latency_ms'][1]:.1f} ms worst")
                 elif command == 'f':
                     player.stop()
                     new_file = select_midi_file()
@@ -367,7 +501,7 @@ def main():
                     print("Unknown command. Type 'q' to quit.")
                     
             except KeyboardInterrupt:
-                player.stop()
+                player.close()
                 break
     
     print("\n🎵 Thanks for using MIDI Player! 🎵")
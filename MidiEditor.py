@@ -1,66 +1,91 @@
 import pretty_midi
-from mido import MidiFile, MidiTrack
+
+from edit_plan import EditPlan
+from midi_events import MidiEventTable
+from midi_renderer import OfflineRenderer, write_wav
+from midi_stream import filter_control_changes
+from render_cache import RenderCache, DEFAULT_CACHE_DIR
 
 class MidiEditor:
     def __init__(self, input_path):
         self.pm = pretty_midi.PrettyMIDI(input_path)
+        self._preview_cache = None
     
+    def plan(self):
+        """Start an EditPlan: queue several edits, then apply() them in one pass over the notes."""
+        return EditPlan(self.pm)
+
     def change_range_to_instrument(self, low_pitch, high_pitch, new_program):
         """Move all notes in pitch range [low, high] to a new instrument."""
-        new_inst = pretty_midi.Instrument(program=new_program)
-        for inst in self.pm.instruments:
-            to_move = [n for n in inst.notes if low_pitch <= n.pitch <= high_pitch]
-            for n in to_move: new_inst.notes.append(n)
-            inst.notes = [n for n in inst.notes if not (low_pitch <= n.pitch <= high_pitch)]
-        self.pm.instruments.append(new_inst)
+        self.plan().change_range_to_instrument(low_pitch, high_pitch, new_program).apply()
     
     def swap_instrument(self, from_program, to_program):
         """Swap all instruments with program X to program Y."""
-        for inst in self.pm.instruments:
-            if inst.program == from_program and not inst.is_drum:
-                inst.program = to_program
+        self.plan().swap_instrument(from_program, to_program).apply()
 
     def remove_notes_above(self, program, pitch_cutoff):
         """Remove notes above a pitch cutoff for a given instrument program."""
-        for inst in self.pm.instruments:
-            if inst.program == program and not inst.is_drum:
-                inst.notes = [n for n in inst.notes if n.pitch <= pitch_cutoff]
+        self.plan().remove_notes_above(program, pitch_cutoff).apply()
 
     def save_pretty_midi(self, output_path):
         self.pm.write(output_path)
 
-    def clean_control_changes(self, input_path, output_path, control=64):
-        """Using Mido, remove given CC from the saved MIDI."""
-        mid = MidiFile(input_path)
-        out = MidiFile(ticks_per_beat=mid.ticks_per_beat)
-        for track in mid.tracks:
-            new = MidiTrack()
-            for msg in track:
-                if not (msg.type == 'control_change' and msg.control == control):
-                    new.append(msg)
-            out.tracks.append(new)
-        out.save(output_path)
+    def preview(self, wav_out, soundfont, cache_dir=DEFAULT_CACHE_DIR):
+        """
+        Render the current edits to WAV with the given .sf2; bars an edit did
+        not touch come from the render cache.
+        """
+        if self._preview_cache is None:
+            self._preview_cache = RenderCache(OfflineRenderer(soundfont), cache_dir)
+        audio = self._preview_cache.render_events(MidiEventTable.from_pretty_midi(self.pm))
+        write_wav(wav_out, audio, self._preview_cache.renderer.sample_rate)
+        return len(audio) / self._preview_cache.renderer.sample_rate
+
+    def output_channel(self, index):
+        """MIDI channel pretty_midi writes instrument `index` on (drums always on 9)."""
+        if self.pm.instruments[index].is_drum:
+            return 9
+        return [c for c in range(16) if c != 9][index % 15]
+
+    def remove_control_changes(self, control=None, channel=None, min_value=0, max_value=127):
+        """
+        Remove control changes in memory, before saving. Each filter left as
+        None matches everything; `control` and `channel` may be a number or
+        a list of numbers, and values must fall in [min_value, max_value].
+        Returns how many were removed.
+        """
+        controls = None if control is None else set([control] if isinstance(control, int) else control)
+        channels = None if channel is None else set([channel] if isinstance(channel, int) else channel)
+        removed = 0
+        for i, inst in enumerate(self.pm.instruments):
+            if channels is not None and self.output_channel(i) not in channels:
+                continue
+            kept = [cc for cc in inst.control_changes
+                    if not ((controls is None or cc.number in controls)
+                            and min_value <= cc.value <= max_value)]
+            removed += len(inst.control_changes) - len(kept)
+            inst.control_changes = kept
+        return removed
+
+    def clean_control_changes(self, input_path, output_path, control=64, channel=None, min_value=0, max_value=127):
+        """Remove matching CCs from a saved MIDI file, streaming its bytes. Returns how many were removed."""
+        return filter_control_changes(input_path, output_path, control, channel, min_value, max_value)
 
     def remove_notes_outside_pitch_and_instruments(self, valid_programs, min_pitch, max_pitch):
         """Keep only notes within pitch range and valid instruments."""
-        for inst in self.pm.instruments:
-            if inst.program not in valid_programs or inst.is_drum:
-                inst.notes = []  # remove all notes if not valid instrument
-            else:
-                inst.notes = [n for n in inst.notes if min_pitch < n.pitch < max_pitch]
+        self.plan().remove_notes_outside_pitch_and_instruments(valid_programs, min_pitch, max_pitch).apply()
     
     def remove_notes_outside_pitch(self, min_pitch, max_pitch):
         """Remove notes outside the specified pitch range."""
-        for inst in self.pm.instruments:
-            inst.notes = [n for n in inst.notes if min_pitch <= n.pitch <= max_pitch]
+        self.plan().remove_notes_outside_pitch(min_pitch, max_pitch).apply()
     
     def remove_instrument(self, program):
         """Remove all notes from a specific instrument program."""
-        self.pm.instruments = [inst for inst in self.pm.instruments if inst.program != program]
+        self.plan().remove_instrument(program).apply()
 
     def remove_outside_instrument(self, valid_programs):
         """Remove all instruments not in the valid programs list."""
-        self.pm.instruments = [inst for inst in self.pm.instruments if inst.program in valid_programs]
+        self.plan().remove_outside_instrument(valid_programs).apply()
 
 
 if __name__ == "__main__":
@@ -69,28 +94,30 @@ if __name__ == "__main__":
     # Range → new instrument (Acoustic Guitar program=24)
     #editor.change_range_to_instrument(0, 140, new_program=14)
 
+    # Queue the edits and apply them in one pass over the notes
+    plan = editor.plan()
     # swap violin to string ensemble
-    editor.swap_instrument(from_program=40, to_program=48)
+    plan.swap_instrument(from_program=40, to_program=48)
     # swap cello to grand piano
-    editor.swap_instrument(from_program=42, to_program=0)
+    plan.swap_instrument(from_program=42, to_program=0)
 
     # 3. Remove notes from program 40 with pitch >80
-    #editor.remove_notes_above(40, 80)
+    #plan.remove_notes_above(40, 80)
 
     # 4. Remove all notes that are:
     #    - F#6 (90) or higher
     #    - E4 (64) or lower
     #    - Not from Violin (40) or Cello (42)
-    #editor.remove_notes_outside_pitch_and_instruments(valid_programs=[40, 42], min_pitch=64, max_pitch=90)
+    #plan.remove_notes_outside_pitch_and_instruments(valid_programs=[40, 42], min_pitch=64, max_pitch=90)
 
-    #editor.remove_outside_instrument(valid_programs=[40, 42])  # Keep only Violin and Cello
+    #plan.remove_outside_instrument(valid_programs=[40, 42])  # Keep only Violin and Cello
 
     # remove non koto notes
-    #editor.remove_instrument(106)
+    #plan.remove_instrument(106)
 
 
-    # Save before Mido edits
-    editor.save_pretty_midi('staged.mid')
+    plan.apply()
 
     # 4. Clean CC64 and save final
-    editor.clean_control_changes('staged.mid', 'CatherineStringCello.mid', control=64)
+    editor.remove_control_changes(control=64)
+    editor.save_pretty_midi('CatherineStringCello.mid')
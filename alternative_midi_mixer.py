@@ -1,11 +1,12 @@
 # alternative_midi_mixer.py - Version without FluidSynth dependency
 
-import mido
-import tempfile
 import os
-import random
 import numpy as np
 
+from midi_events import MidiEventTable
+from midi_humanizer import humanize_events
+from midi_renderer import OfflineRenderer, write_wav
+
 class AlternativeMidiMixer:
     def __init__(self):
         """Initialize without FluidSynth dependency."""
@@ -14,49 +15,37 @@ class AlternativeMidiMixer:
     def humanize_midi(self, midi_in: str, midi_out: str,
                       timing_jitter_ms: float = 10,
                       velocity_jitter: int = 8,
-                      swing: float = 0.1):
+                      swing: float = 0.1,
+                      seed: int = None):
         """
         Add timing & velocity humanization and swing to a MIDI file.
+        Pass a seed for reproducible output.
         """
-        mid = mido.MidiFile(midi_in)
-        ticks_per_beat = mid.ticks_per_beat
-        
-        for track_idx, track in enumerate(mid.tracks):
-            abs_time = 0
-            for msg in track:
-                abs_time += msg.time
-                if msg.type in ('note_on', 'note_off'):
-                    # Calculate jitter
-                    tempo_factor = 120  # Assume 120 BPM as default
-                    jitter_ticks = int(timing_jitter_ms * ticks_per_beat / (60000 / tempo_factor))
-                    
-                    # Apply timing jitter
-                    jitter = random.randint(-jitter_ticks, jitter_ticks)
-                    msg.time = max(0, msg.time + jitter)  # Ensure time doesn't go negative
-                    
-                    # Apply velocity jitter for note_on messages
-                    if msg.type == 'note_on' and hasattr(msg, 'velocity'):
-                        velocity_change = random.randint(-velocity_jitter, velocity_jitter)
-                        msg.velocity = max(1, min(127, msg.velocity + velocity_change))
-                    
-                    # Apply swing: delay every other 8th note
-                    if swing > 0 and ticks_per_beat > 0:
-                        eighth_note = ticks_per_beat // 2
-                        if eighth_note > 0 and (abs_time // eighth_note) % 2:
-                            msg.time += int(swing * ticks_per_beat)
-        
-        mid.save(midi_out)
+        events = MidiEventTable.from_path(midi_in)
+        humanize_events(events, timing_jitter_ms, velocity_jitter, swing,
+                        rng=np.random.default_rng(seed))
+        events.save(midi_out)
+        return events
 
     def process_midi(self, midi_in: str, midi_out: str,
-                     timing_jitter_ms=10, velocity_jitter=8, swing=0.1):
+                     timing_jitter_ms=10, velocity_jitter=8, swing=0.1, seed=None,
+                     wav_out=None, soundfont=None):
         """
         Process MIDI file with humanization effects.
-        This version only processes MIDI and doesn't convert to audio.
+        Pass wav_out to also render audio with a SoundFont (no FluidSynth needed);
+        that needs an explicit soundfont (.sf2 path), checked before anything is written.
         """
+        if wav_out and soundfont is None:
+            raise ValueError("wav_out needs a SoundFont: pass soundfont='path/to/bank.sf2'")
         print(f"Processing MIDI file: {midi_in}")
-        self.humanize_midi(midi_in, midi_out, timing_jitter_ms, velocity_jitter, swing)
+        events = self.humanize_midi(midi_in, midi_out, timing_jitter_ms, velocity_jitter, swing, seed)
         print(f"Humanized MIDI saved to: {midi_out}")
+        if wav_out:
+            write_wav(wav_out, OfflineRenderer(soundfont).render_events(events), 44100)
+            print(f"Rendered audio saved to: {wav_out}")
+            return
         print("Note: To convert to audio, you'll need to:")
+        print("0. Pass wav_out=... to render with a .sf2 SoundFont, or")
         print("1. Install FluidSynth and a SoundFont, or")
         print("2. Use a DAW like Reaper, FL Studio, or Logic Pro")
         print("3. Or use online MIDI to WAV converters")
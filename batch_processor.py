@@ -0,0 +1,177 @@
+# batch_processor.py - Process a whole MIDI library in parallel with MidiProcessor
+
+import argparse
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from midi_processor_clean import MidiProcessor
+from processing_manifest import ProcessingManifest
+
+MIDI_EXTENSIONS = ('.mid', '.midi')
+MANIFEST_NAME = '.midi_manifest.json'
+MANIFEST_SAVE_EVERY = 100  # results between manifest checkpoints
+
+
+def find_midi_files(root: str, suffix: str = '_processed'):
+    """Walk `root` and return every MIDI file that is not already an output."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in MIDI_EXTENSIONS and not stem.endswith(suffix):
+                found.append(os.path.join(dirpath, name))
+    return found
+
+
+def output_path_for(midi_in: str, root: str, output_dir: str = None,
+                    suffix: str = '_processed'):
+    """Where the processed copy of `midi_in` goes (mirrors the tree under output_dir)."""
+    stem, ext = os.path.splitext(midi_in)
+    if output_dir:
+        stem = os.path.join(output_dir, os.path.relpath(stem, root))
+    return f"{stem}{suffix}{ext}"
+
+
+def file_seed(seed, midi_in: str, root: str):
+    """Per-file seed derived from the batch seed and the file's relative path."""
+    if seed is None:
+        return None
+    return [seed, zlib.crc32(os.path.relpath(midi_in, root).encode('utf-8'))]
+
+
+def _process_one(job):
+    """Worker entry point: process one file and report the outcome."""
+    midi_in, midi_out, params = job
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(midi_out) or '.', exist_ok=True)
+        MidiProcessor(verbose=False).process_midi_complete(midi_in, midi_out, **params)
+        return midi_in, midi_out, None, time.perf_counter() - start
+    except Exception as e:
+        return midi_in, midi_out, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+def _process_chunk(jobs):
+    """Worker entry point for a chunk of jobs; one round trip to the pool per chunk."""
+    return [_process_one(job) for job in jobs]
+
+
+class BatchProcessor:
+    """Fans MidiProcessor.process_midi_complete out over a process pool."""
+
+    def __init__(self, workers: int = None, chunksize: int = 4):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = max(1, chunksize)
+
+    def build_jobs(self, root: str, output_dir: str = None, suffix: str = '_processed',
+                   seed=None, **params):
+        jobs = []
+        for midi_in in find_midi_files(root, suffix):
+            midi_out = output_path_for(midi_in, root, output_dir, suffix)
+            jobs.append((midi_in, midi_out, dict(params, seed=file_seed(seed, midi_in, root))))
+        return jobs
+
+    def skip_unchanged(self, jobs, manifest: ProcessingManifest):
+        """
+        Split jobs into those that need processing and a count of skipped ones.
+        Returns (todo, keys, skipped) where keys maps input path -> manifest key.
+        """
+        todo, keys, skipped = [], {}, 0
+        for job in jobs:
+            midi_in, midi_out, params = job
+            key = manifest.job_key(midi_in, params)
+            if manifest.is_current(midi_in, midi_out, key):
+                # Refresh size/mtime so a touched-but-identical file is not re-hashed next run
+                manifest.record(midi_in, midi_out, key)
+                skipped += 1
+            else:
+                keys[midi_in] = key
+                todo.append(job)
+        return todo, keys, skipped
+
+    def run(self, jobs):
+        """Yield (midi_in, midi_out, error, seconds) for each job as results arrive."""
+        if self.workers == 1:
+            for job in jobs:
+                yield _process_one(job)
+            return
+
+        # Chunks are reported in completion order, so one slow file only
+        # delays the results of its own chunk
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(_process_chunk, jobs[i:i + self.chunksize])
+                       for i in range(0, len(jobs), self.chunksize)]
+            for future in as_completed(futures):
+                yield from future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Humanize and process every MIDI file under a directory.")
+    parser.add_argument('root', nargs='?', default='.', help="library directory to walk")
+    parser.add_argument('-o', '--output-dir', help="write outputs here (mirrors the input tree)")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunksize', type=int, default=4, help="files handed to a worker at a time")
+    parser.add_argument('--suffix', default='_processed', help="output filename suffix")
+    parser.add_argument('--seed', type=int, default=None, help="base seed for reproducible output")
+    parser.add_argument('--manifest', help=f"cache manifest path (default: {MANIFEST_NAME} in the output dir)")
+    parser.add_argument('--force', action='store_true', help="reprocess files even if unchanged")
+    parser.add_argument('--timing-jitter-ms', type=float, default=12)
+    parser.add_argument('--velocity-jitter', type=int, default=10)
+    parser.add_argument('--swing', type=float, default=0.08)
+    parser.add_argument('--transpose', type=int, default=0)
+    parser.add_argument('--velocity-scale', type=float, default=1.1)
+    parser.add_argument('--time-stretch', type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    batch = BatchProcessor(workers=args.workers, chunksize=args.chunksize)
+    jobs = batch.build_jobs(args.root, args.output_dir, args.suffix, seed=args.seed,
+                            timing_jitter_ms=args.timing_jitter_ms,
+                            velocity_jitter=args.velocity_jitter,
+                            swing=args.swing,
+                            transpose=args.transpose,
+                            velocity_scale=args.velocity_scale,
+                            time_stretch=args.time_stretch)
+    if not jobs:
+        print("No MIDI files found.")
+        return 0
+
+    start = time.perf_counter()
+    manifest = ProcessingManifest(args.manifest or os.path.join(args.output_dir or args.root, MANIFEST_NAME))
+    if args.force:
+        keys = {job[0]: manifest.job_key(job[0], job[2]) for job in jobs}
+        skipped = 0
+    else:
+        jobs, keys, skipped = batch.skip_unchanged(jobs, manifest)
+    if skipped:
+        print(f"Skipping {skipped} unchanged file(s).")
+    if not jobs:
+        print("Nothing to do.")
+        return 0
+
+    print(f"Processing {len(jobs)} MIDI file(s) with {batch.workers} worker(s)...")
+    failures = 0
+    try:
+        for done, (midi_in, midi_out, error, seconds) in enumerate(batch.run(jobs), 1):
+            if error:
+                failures += 1
+                print(f"✗ {midi_in}: {error}")
+            else:
+                manifest.record(midi_in, midi_out, keys[midi_in])
+                print(f"✓ {midi_in} -> {midi_out} ({seconds * 1000:.0f} ms)")
+            if done % MANIFEST_SAVE_EVERY == 0:
+                manifest.save()
+    finally:
+        manifest.save()
+
+    elapsed = time.perf_counter() - start
+    rate = len(jobs) / elapsed if elapsed > 0 else float('inf')
+    print(f"\nDone: {len(jobs) - failures} ok, {failures} failed in {elapsed:.2f}s ({rate:.1f} files/sec)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# edit_plan.py - Queue MidiEditor operations and apply them in one vectorized pass over the notes
+
+import numpy as np
+import pretty_midi
+
+
+class EditPlan:
+    """
+    Ordered list of note/instrument edits on a PrettyMIDI object.
+
+    Operations are only recorded until apply(). Then every note of every
+    instrument is read once into NumPy arrays (pitch, owning instrument,
+    keep flag), each queued operation becomes one boolean-mask update over
+    those arrays (instrument-level changes such as program swaps only touch
+    a small per-instrument table), and the instruments' note lists are
+    rebuilt once. The result is the same as calling the MidiEditor methods
+    one after another.
+    """
+
+    def __init__(self, pm: pretty_midi.PrettyMIDI):
+        self.pm = pm
+        self.ops = []
+
+    def __len__(self):
+        return len(self.ops)
+
+    # ------------------------------------------------------------------
+    # Queued operations (chainable)
+    # ------------------------------------------------------------------
+
+    def change_range_to_instrument(self, low_pitch, high_pitch, new_program):
+        """Move all notes in pitch range [low, high] to a new instrument."""
+        self.ops.append(('move', low_pitch, high_pitch, new_program))
+        return self
+
+    def swap_instrument(self, from_program, to_program):
+        """Swap all non-drum instruments with program X to program Y."""
+        self.ops.append(('swap', from_program, to_program))
+        return self
+
+    def remove_notes_above(self, program, pitch_cutoff):
+        """Remove notes above a pitch cutoff for a given (non-drum) instrument program."""
+        self.ops.append(('remove_above', program, pitch_cutoff))
+        return self
+
+    def remove_notes_outside_pitch_and_instruments(self, valid_programs, min_pitch, max_pitch):
+        """Keep only notes strictly inside (min, max) on valid non-drum instruments."""
+        self.ops.append(('keep_inside_valid', tuple(valid_programs), min_pitch, max_pitch))
+        return self
+
+    def remove_notes_outside_pitch(self, min_pitch, max_pitch):
+        """Remove notes outside [min, max] on every instrument."""
+        self.ops.append(('keep_inside', min_pitch, max_pitch))
+        return self
+
+    def remove_instrument(self, program):
+        """Remove every instrument with this program."""
+        self.ops.append(('remove_instrument', program))
+        return self
+
+    def remove_outside_instrument(self, valid_programs):
+        """Remove every instrument whose program is not in the list."""
+        self.ops.append(('keep_instruments', tuple(valid_programs)))
+        return self
+
+    # ------------------------------------------------------------------
+    # Compilation
+    # ------------------------------------------------------------------
+
+    def apply(self):
+        """Run the queued operations on the PrettyMIDI object and clear the queue."""
+        instruments = list(self.pm.instruments)
+        # Per-instrument table; instruments created by moves are appended as they appear
+        programs = [inst.program for inst in instruments]
+        drums = [inst.is_drum for inst in instruments]
+        present = [True] * len(instruments)
+
+        # The one traversal of the notes
+        notes = [note for inst in instruments for note in inst.notes]
+        pitch = np.fromiter((note.pitch for note in notes), dtype=np.int64, count=len(notes))
+        counts = [len(inst.notes) for inst in instruments]
+        owner = np.repeat(np.arange(len(instruments)), np.array(counts, dtype=np.int64))
+        keep = np.ones(len(notes), dtype=bool)
+
+        for op in self.ops:
+            kind = op[0]
+            if kind == 'swap':
+                _, from_program, to_program = op
+                for i, program in enumerate(programs):
+                    if present[i] and program == from_program and not drums[i]:
+                        programs[i] = to_program
+                continue
+            if kind == 'remove_instrument':
+                for i, program in enumerate(programs):
+                    if program == op[1]:
+                        present[i] = False
+                continue
+            if kind == 'keep_instruments':
+                for i, program in enumerate(programs):
+                    if program not in op[1]:
+                        present[i] = False
+                continue
+
+            # Note-level operations see each note's current instrument
+            live = np.array(present, dtype=bool)[owner] & keep
+            if kind == 'move':
+                _, low, high, new_program = op
+                moved = live & (pitch >= low) & (pitch <= high)
+                owner[moved] = len(instruments)
+                instruments.append(pretty_midi.Instrument(program=new_program))
+                programs.append(new_program)
+                drums.append(False)
+                present.append(True)
+                continue
+
+            note_program = np.array(programs, dtype=np.int64)[owner]
+            melodic = ~np.array(drums, dtype=bool)[owner]
+            if kind == 'remove_above':
+                _, program, cutoff = op
+                keep &= ~(live & (note_program == program) & melodic & (pitch > cutoff))
+            elif kind == 'keep_inside_valid':
+                _, valid, low, high = op
+                inside = np.isin(note_program, valid) & melodic & (pitch > low) & (pitch < high)
+                keep &= ~live | inside
+            elif kind == 'keep_inside':
+                _, low, high = op
+                keep &= ~live | ((pitch >= low) & (pitch <= high))
+
+        # Rebuild note lists: kept notes grouped by final owner, original order within each.
+        # Notes only ever leave an original instrument, so one that still owns as
+        # many as it started with is unchanged and keeps its list.
+        rows = np.flatnonzero(keep)
+        rows = rows[np.argsort(owner[rows], kind='stable')]
+        bounds = np.searchsorted(owner[rows], np.arange(len(instruments) + 1)).tolist()
+        result = []
+        for i, inst in enumerate(instruments):
+            if not present[i]:
+                continue
+            inst.program = programs[i]
+            begin, end = bounds[i], bounds[i + 1]
+            if i >= len(counts) or end - begin != counts[i]:
+                inst.notes = [notes[row] for row in rows[begin:end].tolist()]
+            result.append(inst)
+        self.pm.instruments = result
+        self.ops = []
+        return self.pm
@@ -0,0 +1,444 @@
+# midi_events.py - Array-backed MIDI event table shared by the processing tools
+
+import io
+import struct
+
+import mido
+import numpy as np
+
+# Event type codes stored in MidiEventTable.type
+NOTE_OFF = 0
+NOTE_ON = 1
+POLYTOUCH = 2
+CONTROL_CHANGE = 3
+PROGRAM_CHANGE = 4
+AFTERTOUCH = 5
+PITCHWHEEL = 6
+OTHER = 7  # meta and sysex messages, kept verbatim in MidiEventTable.extra
+
+TYPE_CODES = {
+    'note_off': NOTE_OFF,
+    'note_on': NOTE_ON,
+    'polytouch': POLYTOUCH,
+    'control_change': CONTROL_CHANGE,
+    'program_change': PROGRAM_CHANGE,
+    'aftertouch': AFTERTOUCH,
+    'pitchwheel': PITCHWHEEL,
+}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+# Status byte high nibble for each channel message type (index = type code)
+STATUS_NIBBLES = np.array([0x80, 0x90, 0xA0, 0xB0, 0xC0, 0xD0, 0xE0], dtype=np.uint8)
+
+# Which mido attributes map onto the pitch / velocity columns for each type
+_DATA_FIELDS = {
+    NOTE_OFF: ('note', 'velocity'),
+    NOTE_ON: ('note', 'velocity'),
+    POLYTOUCH: ('note', 'value'),
+    CONTROL_CHANGE: ('control', 'value'),
+    PROGRAM_CHANGE: ('program', None),
+    AFTERTOUCH: ('value', None),
+    PITCHWHEEL: ('pitch', None),
+}
+
+
+class MidiEventTable:
+    """
+    Columnar view of every event in a MIDI file.
+
+    Each row is one message. Channel messages live entirely in the parallel
+    NumPy columns; meta and sysex messages keep their mido object in `extra`
+    so the file can be written back without losing anything. For non-note
+    messages the `pitch` column holds the first data value (controller,
+    program, pitchwheel value) and `velocity` the second (CC value, pressure).
+
+    Rows are kept sorted by (track, tick) with file order preserved for ties,
+    so transforms can work on whole columns at once.
+    """
+
+    def __init__(self, tick, track, channel, type, pitch, velocity, extra,
+                 ticks_per_beat=480, midi_type=1, num_tracks=None):
+        self.tick = np.asarray(tick, dtype=np.int64)
+        self.track = np.asarray(track, dtype=np.int32)
+        self.channel = np.asarray(channel, dtype=np.int8)
+        self.type = np.asarray(type, dtype=np.int8)
+        self.pitch = np.asarray(pitch, dtype=np.int16)
+        self.velocity = np.asarray(velocity, dtype=np.int16)
+        self.extra = np.asarray(extra, dtype=object)
+        self.ticks_per_beat = ticks_per_beat
+        self.midi_type = midi_type
+        if num_tracks is None:
+            num_tracks = int(self.track.max()) + 1 if len(self.track) else 0
+        self.num_tracks = num_tracks
+        self.duration = np.full(len(self.tick), -1, dtype=np.int64)
+        self.refresh_durations()
+
+    def __len__(self):
+        return len(self.tick)
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_midi_file(cls, mid: mido.MidiFile):
+        """Build a table from a parsed mido.MidiFile."""
+        n = sum(len(track) for track in mid.tracks)
+        tick = np.empty(n, dtype=np.int64)
+        track_col = np.empty(n, dtype=np.int32)
+        channel = np.full(n, -1, dtype=np.int8)
+        type_col = np.full(n, OTHER, dtype=np.int8)
+        pitch = np.zeros(n, dtype=np.int16)
+        velocity = np.zeros(n, dtype=np.int16)
+        extra = np.empty(n, dtype=object)
+
+        row = 0
+        for track_idx, track in enumerate(mid.tracks):
+            start = row
+            for msg in track:
+                tick[row] = msg.time
+                code = TYPE_CODES.get(msg.type)
+                if code is None:
+                    extra[row] = msg
+                else:
+                    first, second = _DATA_FIELDS[code]
+                    type_col[row] = code
+                    channel[row] = msg.channel
+                    pitch[row] = getattr(msg, first)
+                    if second:
+                        velocity[row] = getattr(msg, second)
+                row += 1
+            track_col[start:row] = track_idx
+            # Delta times -> absolute ticks within the track
+            np.cumsum(tick[start:row], out=tick[start:row])
+
+        return cls(tick, track_col, channel, type_col, pitch, velocity, extra,
+                   ticks_per_beat=mid.ticks_per_beat, midi_type=mid.type,
+                   num_tracks=len(mid.tracks))
+
+    @classmethod
+    def from_path(cls, path: str):
+        """Parse a .mid file from disk."""
+        return cls.from_midi_file(mido.MidiFile(path))
+
+    @classmethod
+    def from_pretty_midi(cls, pm):
+        """Build a table from a pretty_midi.PrettyMIDI object."""
+        # pretty_midi's own writer decides the tick layout, so go through it
+        # once in memory instead of re-deriving ticks from note seconds.
+        buffer = io.BytesIO()
+        pm.write(buffer)
+        buffer.seek(0)
+        return cls.from_midi_file(mido.MidiFile(file=buffer))
+
+    # ------------------------------------------------------------------
+    # Serialization
+    # ------------------------------------------------------------------
+
+    def to_midi_file(self) -> mido.MidiFile:
+        """Rebuild a mido.MidiFile from the columns."""
+        self.sort()
+        mid = mido.MidiFile(type=self.midi_type, ticks_per_beat=self.ticks_per_beat)
+        deltas = self.deltas()
+        bounds = self.track_bounds()
+
+        for track_idx in range(self.num_tracks):
+            track = mido.MidiTrack()
+            for row in range(bounds[track_idx], bounds[track_idx + 1]):
+                delta = int(deltas[row])
+                code = self.type[row]
+                if code == OTHER:
+                    track.append(self.extra[row].copy(time=delta))
+                    continue
+                first, second = _DATA_FIELDS[code]
+                fields = {'channel': int(self.channel[row]), first: int(self.pitch[row]),
+                          'time': delta}
+                if second:
+                    fields[second] = int(self.velocity[row])
+                track.append(mido.Message(TYPE_NAMES[code], **fields))
+            mid.tracks.append(track)
+        return mid
+
+    def to_pretty_midi(self):
+        """Rebuild a pretty_midi.PrettyMIDI object from the columns."""
+        import pretty_midi
+
+        return pretty_midi.PrettyMIDI(io.BytesIO(self.to_bytes()))
+
+    def to_bytes(self) -> bytes:
+        """
+        Standard MIDI File bytes straight from the columns, encoded like
+        mido's writer: running status for channel messages (reset by meta and
+        sysex events) and a single end_of_track closing each track.
+        """
+        self.sort()
+        chunks = [b'MThd' + struct.pack('>IHHH', 6, self.midi_type, self.num_tracks, self.ticks_per_beat)]
+        bounds = self.track_bounds()
+        for track_idx in range(self.num_tracks):
+            chunks.append(self._encode_track(bounds[track_idx], bounds[track_idx + 1]))
+        return b''.join(chunks)
+
+    def _encode_track(self, begin, end):
+        """One MTrk chunk, written into a single preallocated bytearray."""
+        rows = np.arange(begin, end)
+        other = rows[self.type[rows] == OTHER]
+        end_tick = int(self.tick[end - 1]) if end > begin else 0
+        # end_of_track rows are dropped and one is written last, as mido does;
+        # dropping them by row folds their deltas into the next event
+        blobs = {}
+        for row in other.tolist():
+            msg = self.extra[row]
+            if msg.type == 'end_of_track':
+                continue
+            if msg.type == 'sysex':
+                blobs[row] = bytes((0xF0,)) + _varlen(len(msg.data) + 1) + bytes(msg.data) + b'\xf7'
+            else:
+                blobs[row] = bytes(msg.bytes())
+        rows = rows[(self.type[rows] != OTHER) | np.isin(rows, list(blobs))]
+
+        tick = self.tick[rows]
+        delta = np.diff(tick, prepend=0)
+        if len(delta) and (delta.min() < 0 or delta.max() > 0x0FFFFFFF):
+            raise ValueError("Delta times must be between 0 and 0x0FFFFFFF")
+        delta_len = 1 + (delta >= 1 << 7) + (delta >= 1 << 14) + (delta >= 1 << 21)
+
+        channel = self.type[rows] != OTHER
+        status = np.zeros(len(rows), dtype=np.uint8)
+        data1 = np.zeros(len(rows), dtype=np.uint8)
+        data2 = np.zeros(len(rows), dtype=np.uint8)
+        status[channel], data1[channel], data2[channel] = self.encode_channel_messages(rows[channel])
+        data_len = np.where(channel, 2, 0) - np.isin(self.type[rows], (PROGRAM_CHANGE, AFTERTOUCH))
+        # Running status: the status byte is omitted when the previous event
+        # was a channel message with the same status
+        repeated = np.zeros(len(rows), dtype=bool)
+        repeated[1:] = channel[1:] & channel[:-1] & (status[1:] == status[:-1])
+        status_len = channel & ~repeated
+
+        event_len = delta_len + status_len + data_len
+        meta = np.flatnonzero(~channel)  # rows are ascending, so these line up with blobs
+        blob_list = list(blobs.values())
+        event_len[meta] += np.array([len(blob) for blob in blob_list], dtype=np.int64)
+        offset = np.concatenate(([0], np.cumsum(event_len)))
+        eot_delta = end_tick - (int(tick[-1]) if len(tick) else 0)
+        eot = _varlen(eot_delta) + b'\xff\x2f\x00'
+        size = int(offset[-1]) + len(eot)
+
+        chunk = bytearray(8 + size)
+        chunk[:8] = b'MTrk' + struct.pack('>I', size)
+        body = np.frombuffer(chunk, dtype=np.uint8, offset=8)
+        start = offset[:-1]
+        for shift in range(4):
+            has = delta_len > shift
+            pos = start[has] + delta_len[has] - 1 - shift
+            body[pos] = ((delta[has] >> (7 * shift)) & 0x7F) | (0x80 if shift else 0)
+        pos = start + delta_len
+        body[pos[status_len]] = status[status_len]
+        pos = pos + status_len
+        body[pos[channel]] = data1[channel]
+        two = data_len == 2
+        body[pos[two] + 1] = data2[two]
+        for p, blob in zip((pos[meta] + 8).tolist(), blob_list):
+            chunk[p:p + len(blob)] = blob
+        chunk[8 + int(offset[-1]):] = eot
+        return bytes(chunk)
+
+    def save(self, path: str):
+        """Write the table to a .mid file."""
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    def copy(self):
+        """Deep copy of all columns."""
+        table = MidiEventTable.__new__(MidiEventTable)
+        table.__dict__.update({key: value.copy() if isinstance(value, np.ndarray) else value
+                               for key, value in self.__dict__.items()})
+        return table
+
+    # ------------------------------------------------------------------
+    # Row selection helpers
+    # ------------------------------------------------------------------
+
+    def note_on_mask(self):
+        """Rows that start a sounding note (note_on with velocity > 0)."""
+        return (self.type == NOTE_ON) & (self.velocity > 0)
+
+    def note_off_mask(self):
+        """Rows that end a note (note_off, or note_on with velocity 0)."""
+        return (self.type == NOTE_OFF) | ((self.type == NOTE_ON) & (self.velocity == 0))
+
+    def note_mask(self):
+        """All note_on / note_off rows."""
+        return (self.type == NOTE_ON) | (self.type == NOTE_OFF)
+
+    def channel_rows(self):
+        """Indices of all channel (non-meta, non-sysex) messages."""
+        return np.flatnonzero(self.type != OTHER)
+
+    def encode_channel_messages(self, rows=None):
+        """
+        Raw MIDI bytes of channel messages as three uint8 arrays
+        (status, data1, data2). data2 is 0 for two-byte messages.
+        """
+        if rows is None:
+            rows = self.channel_rows()
+        types = self.type[rows]
+        status = STATUS_NIBBLES[types] | self.channel[rows].astype(np.uint8)
+        data1 = self.pitch[rows].astype(np.int32)
+        data2 = self.velocity[rows].astype(np.int32)
+
+        # Pitchwheel stores a signed 14-bit value in the pitch column
+        bend = types == PITCHWHEEL
+        value = data1[bend] + 8192
+        data1[bend] = value & 0x7F
+        data2[bend] = value >> 7
+        return status, data1.astype(np.uint8), data2.astype(np.uint8)
+
+    def meta_rows(self, meta_type: str):
+        """Indices of meta messages of the given mido type (e.g. 'set_tempo')."""
+        other = np.flatnonzero(self.type == OTHER)
+        return np.array([row for row in other if self.extra[row].type == meta_type],
+                        dtype=np.int64)
+
+    def track_bounds(self):
+        """Row offsets where each track starts, plus the total row count."""
+        return np.searchsorted(self.track, np.arange(self.num_tracks + 1), side='left')
+
+    # ------------------------------------------------------------------
+    # Timing
+    # ------------------------------------------------------------------
+
+    def sort(self):
+        """Restore (track, tick) order, keeping the existing order for ties."""
+        order = np.lexsort((np.arange(len(self)), self.tick, self.track))
+        if np.any(order != np.arange(len(self))):
+            self.take(order)
+
+    def take(self, rows):
+        """Keep only the given rows (index or boolean mask), in that order."""
+        for name in ('tick', 'track', 'channel', 'type', 'pitch', 'velocity',
+                     'extra', 'duration'):
+            setattr(self, name, getattr(self, name)[rows])
+
+    def deltas(self):
+        """Delta time of every row relative to the previous row in its track."""
+        deltas = np.diff(self.tick, prepend=0)
+        starts = self.track_bounds()[:-1]
+        starts = starts[starts < len(self)]
+        deltas[starts] = self.tick[starts]
+        return deltas
+
+    def set_deltas(self, deltas):
+        """Replace absolute ticks from per-row delta times."""
+        deltas = np.asarray(deltas, dtype=np.int64)
+        total = np.cumsum(deltas)
+        bounds = self.track_bounds()
+        # Subtract everything accumulated before each track's first row
+        offsets = np.concatenate(([0], total))[bounds[:-1]]
+        self.tick = total - np.repeat(offsets, np.diff(bounds))
+
+    def note_pairs(self):
+        """
+        Match every note-on row to its note-off row.
+
+        Returns (on_rows, off_rows); notes are paired first-in first-out per
+        (track, channel, pitch): each note-on takes the first unused note-off
+        after it. Note-offs with no note-on sounding on their key (a stray off
+        before the first on, say) and note-ons without a matching off are
+        left out.
+        """
+        key = (self.track.astype(np.int64) << 16) | (self.channel.astype(np.int64) << 8) \
+            | self.pitch.astype(np.int64)
+        on_rows = np.flatnonzero(self.note_on_mask())
+        off_rows = np.flatnonzero(self.note_off_mask())
+        if len(on_rows) == 0 or len(off_rows) == 0:
+            return on_rows[:0], off_rows[:0]
+        off_rows = off_rows[~_stray_offs(key, self.tick, on_rows, off_rows)]
+
+        on_keys = _ranked_keys(key[on_rows], self.tick[on_rows])
+        off_keys = _ranked_keys(key[off_rows], self.tick[off_rows])
+        if len(off_rows) == 0:
+            return on_rows[:0], off_rows
+
+        order = np.argsort(off_keys, kind='stable')
+        sorted_off = off_keys[order]
+        pos = np.minimum(np.searchsorted(sorted_off, on_keys), len(order) - 1)
+        matched = sorted_off[pos] == on_keys
+        return on_rows[matched], off_rows[order[pos[matched]]]
+
+    def refresh_durations(self):
+        """Recompute the duration column (ticks) for every note-on row."""
+        self.duration.fill(-1)
+        on_rows, off_rows = self.note_pairs()
+        self.duration[on_rows] = self.tick[off_rows] - self.tick[on_rows]
+
+    # ------------------------------------------------------------------
+    # Vectorized effects
+    # ------------------------------------------------------------------
+
+    def transpose(self, semitones: int):
+        """Shift every note_on / note_off pitch, clamped to 0-127."""
+        if semitones:
+            notes = self.note_mask()
+            self.pitch[notes] = np.clip(self.pitch[notes] + semitones, 0, 127)
+
+    def scale_velocity(self, factor: float):
+        """Scale note-on velocities, clamped to 1-127 so notes stay audible."""
+        if factor != 1.0:
+            notes = self.note_on_mask()
+            scaled = (self.velocity[notes] * factor).astype(np.int64)
+            self.velocity[notes] = np.clip(scaled, 1, 127)
+
+    def time_stretch(self, factor: float):
+        """Scale every delta time (truncating, like the original per-message loop)."""
+        if factor != 1.0:
+            self.set_deltas((self.deltas() * factor).astype(np.int64))
+            self.refresh_durations()
+
+
+def _varlen(value):
+    """Encode a variable-length quantity."""
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def _stray_offs(key, tick, on_rows, off_rows):
+    """
+    Mask over off_rows of note-offs that arrive while no note-on is pending
+    on their key, found from a running balance of ons (+1) and offs (-1).
+    """
+    rows = np.concatenate((on_rows, off_rows))
+    step = np.concatenate((np.ones(len(on_rows), dtype=np.int64), np.full(len(off_rows), -1, dtype=np.int64)))
+    order = np.lexsort((rows, tick[rows], key[rows]))
+    keys, step = key[rows][order], step[order]
+    first = np.diff(keys, prepend=-1) != 0
+    group = np.cumsum(first) - 1
+    # Running balance per key, and its running minimum; later keys are
+    # shifted far enough down that an earlier key's minimum never carries over
+    total = np.cumsum(step)
+    balance = total - (total - step)[first][group]
+    spread = 2 * len(step) + 2
+    lowest = np.minimum.accumulate(balance - group * spread) + group * spread
+    # Notes pending after each event; an off is stray if none were pending before it
+    pending = balance - np.minimum(lowest, 0)
+    before = np.concatenate(([0], pending[:-1]))
+    before[first] = 0
+    stray = np.zeros(len(rows), dtype=bool)
+    stray[order] = (step < 0) & (before == 0)
+    return stray[len(on_rows):]
+
+
+def _ranked_keys(keys, ticks):
+    """Combine a group key with each row's rank inside its group (ordered by tick)."""
+    if len(keys) == 0:
+        return keys
+    order = np.lexsort((np.arange(len(keys)), ticks, keys))
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.diff(sorted_keys, prepend=-1))
+    group_start = np.repeat(starts, np.diff(np.append(starts, len(keys))))
+    ranks = np.empty(len(keys), dtype=np.int64)
+    ranks[order] = np.arange(len(keys)) - group_start
+    return (keys << 24) | ranks
@@ -0,0 +1,153 @@
+# midi_humanizer.py - Vectorized timing / velocity humanization over MidiEventTable
+
+import numpy as np
+
+from midi_events import MidiEventTable
+from tempo_map import TempoMap
+
+# Grid cells per beat; swing pairs up consecutive cells inside each beat
+SWING_GRIDS = {
+    '8th': 2,
+    '16th': 4,
+    '8th_triplet': 3,
+    '16th_triplet': 6,
+}
+
+
+def swing_ticks(ticks, ticks_per_beat: int, ratio: float, grid: str = '8th'):
+    """
+    Swung positions for absolute `ticks`.
+
+    Each beat is cut into grid cells and consecutive cells are paired
+    (with an odd cell count the last cell of the beat stays straight).
+    Within a pair, the on-beat cell is stretched to `ratio` of the pair and
+    the off-beat cell squeezed into the rest, so a tick on the off-beat grid
+    line lands exactly at the swung position and everything between moves
+    proportionally. Pair boundaries do not move, which keeps beats in place
+    and the mapping monotonic: events never drift or change order.
+    ratio 0.5 is straight, 2/3 is triplet feel.
+    """
+    if grid not in SWING_GRIDS:
+        raise ValueError(f"Unknown swing grid {grid!r}; choose from {', '.join(SWING_GRIDS)}")
+    if not 0 < ratio < 1:
+        raise ValueError(f"Swing ratio must be between 0 and 1, got {ratio}")
+    ticks = np.asarray(ticks, dtype=np.int64)
+    divisions = SWING_GRIDS[grid]
+    cell = ticks_per_beat / divisions
+
+    position = np.mod(ticks, ticks_per_beat).astype(np.float64)
+    pair = np.floor(position / (2 * cell))
+    paired = 2 * pair + 1 < divisions
+    within = position - pair * 2 * cell
+    swung = np.where(within < cell,
+                     within * 2 * ratio,
+                     2 * cell * ratio + (within - cell) * 2 * (1 - ratio))
+    shift = np.where(paired, np.rint(swung - within), 0).astype(np.int64)
+    return ticks + shift
+
+
+def swing_events(events: MidiEventTable, ratio: float = 0.6, grid: str = '8th'):
+    """
+    Apply swing_ticks to every event in place. Order within each track is
+    unchanged, and each track's end tick is kept so the file length stays.
+    """
+    if ratio != 0.5 and len(events):
+        events.sort()
+        bounds = events.track_bounds()
+        last = bounds[1:][bounds[1:] > bounds[:-1]] - 1
+        track_end = np.repeat(events.tick[last], np.diff(bounds)[bounds[1:] > bounds[:-1]])
+        events.tick = np.minimum(swing_ticks(events.tick, events.ticks_per_beat, ratio, grid), track_end)
+        events.tick[last] = track_end[last]
+        events.refresh_durations()
+    return events
+
+
+def humanize_events(events: MidiEventTable,
+                    timing_jitter_ms: float = 10,
+                    velocity_jitter: int = 8,
+                    swing: float = 0.1,
+                    rng: np.random.Generator = None,
+                    tempo_map: TempoMap = None,
+                    duration_jitter_ms: float = None,
+                    swing_grid: str = '8th'):
+    """
+    Add timing & velocity humanization and swing to an event table in place.
+
+    Works on notes rather than messages: every note-on is paired with its
+    note-off, the onset is jittered and the note-off follows it at the
+    jittered duration, so a note can never end before it starts. New ticks
+    stay inside the track's original length, and repeated notes on the same
+    key keep their order and do not overlap. Unpaired note messages are left
+    where they are.
+
+    Swing runs first, as a grid remap (see swing_ticks) of the whole table:
+    `swing` is how far, in beats, an off-beat on `swing_grid` is delayed.
+
+    All random offsets are drawn in one call per column from `rng`, so the
+    same seed always gives the same output. Jitter in ms is converted to
+    ticks with the file's tempo map; pass one in to reuse it.
+    `duration_jitter_ms` defaults to `timing_jitter_ms`.
+    """
+    if swing_grid not in SWING_GRIDS:
+        raise ValueError(f"Unknown swing grid {swing_grid!r}; choose from {', '.join(SWING_GRIDS)}")
+    if rng is None:
+        rng = np.random.default_rng()
+    if duration_jitter_ms is None:
+        duration_jitter_ms = timing_jitter_ms
+
+    # No swing for swing <= 0, as before the grid remap
+    if swing > 0:
+        cell = 1 / SWING_GRIDS[swing_grid]
+        swing_events(events, min(0.5 + swing / (2 * cell), 0.95), swing_grid)
+
+    on_rows, off_rows = events.note_pairs()
+    onsets = events.tick[on_rows]
+    durations = events.tick[off_rows] - onsets
+
+    # Timing jitter on absolute ticks, sized by the tempo in effect at each note
+    if tempo_map is None:
+        tempo_map = TempoMap.from_event_table(events)
+    jitter_ticks = tempo_map.ms_to_ticks(timing_jitter_ms, onsets).astype(np.int64)
+    new_onsets = onsets + rng.integers(-jitter_ticks, jitter_ticks, endpoint=True)
+    duration_ticks = tempo_map.ms_to_ticks(duration_jitter_ms, onsets).astype(np.int64)
+    new_durations = durations + rng.integers(-duration_ticks, duration_ticks, endpoint=True)
+    # Notes keep at least one tick, or zero if they had none
+    new_durations = np.maximum(new_durations, np.minimum(durations, 1))
+
+    # Keep every note inside its track's original length
+    bounds = events.track_bounds()
+    track_end = np.zeros(events.num_tracks, dtype=np.int64)
+    filled = bounds[1:] > bounds[:-1]
+    track_end[filled] = events.tick[bounds[1:][filled] - 1]
+    note_end = track_end[events.track[on_rows]]
+    new_onsets = np.clip(new_onsets, 0, note_end)
+
+    # Per key (track, channel, pitch), in original order: onsets never pass
+    # the previous note's onset, and each note ends by the next one's start
+    key = (events.track[on_rows].astype(np.int64) << 16) \
+        | (events.channel[on_rows].astype(np.int64) << 8) | events.pitch[on_rows].astype(np.int64)
+    order = np.lexsort((on_rows, onsets, key))
+    group = np.cumsum(np.diff(key[order], prepend=-1) != 0)
+    span = int(note_end.max()) + 1 if len(note_end) else 1
+    sorted_onsets = np.maximum.accumulate(new_onsets[order] + group * span) - group * span
+    next_onset = np.full(len(order), np.iinfo(np.int64).max)
+    same_key = group[1:] == group[:-1]
+    next_onset[:-1][same_key] = sorted_onsets[1:][same_key]
+    new_offsets = np.minimum(np.minimum(sorted_onsets + new_durations[order], next_onset), note_end[order])
+    # Never before tick 0 or the note's own onset
+    sorted_onsets = np.maximum(sorted_onsets, 0)
+    new_offsets = np.maximum(new_offsets, sorted_onsets)
+
+    events.tick[on_rows[order]] = sorted_onsets
+    events.tick[off_rows[order]] = new_offsets
+
+    # Velocity jitter for sounding note-ons only; velocity-0 note-ons are note-offs
+    note_ons = np.flatnonzero(events.note_on_mask())
+    velocity_change = rng.integers(-velocity_jitter, velocity_jitter,
+                                   size=len(note_ons), endpoint=True)
+    events.velocity[note_ons] = np.clip(events.velocity[note_ons] + velocity_change, 1, 127)
+
+    # Stable re-sort restores per-track time order; deltas follow from it on save
+    events.sort()
+    events.refresh_durations()
+    return events
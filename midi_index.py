@@ -0,0 +1,333 @@
+# midi_index.py - Persistent SQLite catalog of MIDI file contents for fast library search
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from midi_stream import MidiStream, MidiStreamError
+
+DEFAULT_INDEX_PATH = '.midi_index.sqlite'
+MIDI_EXTENSIONS = ('.mid', '.midi')
+SCHEMA_VERSION = 2
+DRUM_CHANNEL = 9
+DRUM_PROGRAM = 128              # file_programs row for channel-10 percussion
+PARALLEL_MIN_FILES = 64         # fewer changed files than this are scanned in-process
+COMMIT_EVERY = 500              # rows between commits, so an interrupted build keeps its progress
+
+NOTE_NAMES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+
+
+def parse_pitch(text: str):
+    """MIDI pitch from a number or a note name with octave (C4 = 60, F#6 = 90, Bb2 = 46)."""
+    text = text.strip()
+    if text.lstrip('-').isdigit():
+        return int(text)
+    name = text[0].upper()
+    if name not in NOTE_NAMES:
+        raise ValueError(f"Not a pitch: {text!r}")
+    rest = text[1:]
+    accidental = 0
+    while rest[:1] in ('#', 'b'):
+        accidental += 1 if rest[0] == '#' else -1
+        rest = rest[1:]
+    return (int(rest) + 1) * 12 + NOTE_NAMES[name] + accidental
+
+
+def program_histogram(notes, program_changes):
+    """
+    {program: (note_count, min_pitch, max_pitch)} for a file's notes.
+    Each note takes the program in effect on its channel at its tick (0 if
+    none yet); percussion on channel 10 is grouped under DRUM_PROGRAM.
+    """
+    if not notes:
+        return {}
+    note_ticks, note_channels, pitches = (np.array(column, dtype=np.int64) for column in zip(*notes))
+    programs = np.zeros(len(pitches), dtype=np.int64)
+    if program_changes:
+        change_ticks, change_channels, values = (np.array(column, dtype=np.int64)
+                                                 for column in zip(*program_changes))
+        span = int(max(note_ticks.max(), change_ticks.max())) + 1
+        change_keys = change_channels * span + change_ticks
+        order = np.argsort(change_keys, kind='stable')
+        change_keys, values = change_keys[order], values[order]
+        pos = np.searchsorted(change_keys, note_channels * span + note_ticks, side='right') - 1
+        found = (pos >= 0) & (change_keys[np.maximum(pos, 0)] // span == note_channels)
+        programs[found] = values[pos[found]]
+    programs[note_channels == DRUM_CHANNEL] = DRUM_PROGRAM
+
+    histogram = {}
+    for program in np.unique(programs):
+        selected = pitches[programs == program]
+        histogram[int(program)] = (len(selected), int(selected.min()), int(selected.max()))
+    return histogram
+
+
+def scan_metadata(path: str):
+    """
+    Catalog row for one file from a single skipping pass: (bpm, duration,
+    tracks, note_count, min_pitch, max_pitch, min_bpm, max_bpm,
+    tempo_changes, histogram).
+    """
+    with MidiStream(path) as stream:
+        tempo_map, end_tick, notes, program_changes = stream.scan_summary()
+        tracks = stream.num_tracks
+    histogram = program_histogram(notes, program_changes)
+    bpms = 60000000 / tempo_map.tempos
+    pitches = [(low, high) for _, low, high in histogram.values()]
+    return (tempo_map.bpm_at(0), tempo_map.tick_to_seconds(end_tick), tracks, len(notes),
+            min((low for low, _ in pitches), default=None), max((high for _, high in pitches), default=None),
+            float(bpms.min()), float(bpms.max()), len(tempo_map) - 1, histogram)
+
+
+def _scan_job(path):
+    """Worker entry point: never raises, so one bad file cannot stop the pool."""
+    try:
+        return path, scan_metadata(path), None
+    except (OSError, MidiStreamError, IndexError) as e:
+        return path, None, str(e)
+
+
+def _list_midi_files(root: str, recursive: bool):
+    """(path, stat) for MIDI files under root; os.scandir supplies the stat without extra syscalls."""
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"Warning: cannot read {directory}: {e}")
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    pending.append(entry.path)
+            elif os.path.splitext(entry.name)[1].lower() in MIDI_EXTENSIONS:
+                yield entry.path, entry.stat()
+
+
+class MidiIndex:
+    """
+    SQLite catalog of what is inside every MIDI file.
+
+    `files` has one row per file: stat, tempo summary (starting BPM, min/max
+    BPM, number of tempo changes), duration, tracks and overall note count
+    and pitch range. `file_programs` has one row per (file, program) with
+    that instrument's note count and pitch range, indexed by program so
+    "program 107 above C6" is a single index lookup.
+
+    refresh() stats every file under a root (cheap, from the directory
+    listing) and only scans the ones whose mtime or size changed, in a
+    process pool when there are many.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.db.execute('DROP TABLE IF EXISTS file_programs')
+            self.db.execute('DROP TABLE IF EXISTS files')
+            self.db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                bpm REAL,
+                duration REAL,
+                tracks INTEGER,
+                programs TEXT,
+                notes INTEGER,
+                min_pitch INTEGER,
+                max_pitch INTEGER,
+                min_bpm REAL,
+                max_bpm REAL,
+                tempo_changes INTEGER
+            )""")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS file_programs (
+                path TEXT NOT NULL REFERENCES files (path) ON DELETE CASCADE,
+                program INTEGER NOT NULL,
+                notes INTEGER NOT NULL,
+                min_pitch INTEGER NOT NULL,
+                max_pitch INTEGER NOT NULL,
+                PRIMARY KEY (path, program)
+            )""")
+        self.db.execute('CREATE INDEX IF NOT EXISTS files_bpm ON files (bpm)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS file_programs_program '
+                        'ON file_programs (program, max_pitch, min_pitch)')
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _store(self, path, stat, metadata):
+        """Replace one file's rows. Unreadable files get NULL metadata so they are not rescanned."""
+        self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+        if metadata is None:
+            self.db.execute('INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)',
+                            (path, stat.st_mtime_ns, stat.st_size))
+            return
+        *summary, histogram = metadata
+        programs = ' '.join(str(program) for program in sorted(histogram) if program != DRUM_PROGRAM)
+        self.db.execute('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (path, stat.st_mtime_ns, stat.st_size, *summary[:3], programs, *summary[3:]))
+        self.db.executemany('INSERT INTO file_programs VALUES (?, ?, ?, ?, ?)',
+                            [(path, program, *values) for program, values in histogram.items()])
+
+    def refresh(self, root: str = '.', recursive: bool = True, workers: int = None):
+        """
+        Bring the rows under `root` up to date. Returns (scanned, unchanged,
+        removed) counts. workers=None uses every core once enough files changed.
+        """
+        root = os.path.abspath(root)
+        prefix = root.rstrip(os.sep) + os.sep
+        known = {path: (mtime_ns, size) for path, mtime_ns, size in self.db.execute(
+            'SELECT path, mtime_ns, size FROM files WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))}
+
+        seen = {}
+        changed = []
+        for path, stat in _list_midi_files(root, recursive):
+            seen[path] = stat
+            if known.get(path) != (stat.st_mtime_ns, stat.st_size):
+                changed.append(path)
+
+        if len(changed) >= PARALLEL_MIN_FILES and workers != 1:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            chunksize = max(1, min(64, len(changed) // ((workers or os.cpu_count() or 1) * 4)))
+            results = executor.map(_scan_job, changed, chunksize=chunksize)
+        else:
+            executor = None
+            results = map(_scan_job, changed)
+        try:
+            for count, (path, metadata, error) in enumerate(results, 1):
+                if error:
+                    print(f"Warning: could not index {path}: {error}")
+                self._store(path, seen[path], metadata)
+                if count % COMMIT_EVERY == 0:
+                    self.db.commit()
+        finally:
+            if executor:
+                executor.shutdown()
+            self.db.commit()
+
+        if not recursive:
+            known = {path: value for path, value in known.items() if os.path.dirname(path) == root}
+        removed = [(path,) for path in known if path not in seen]
+        with self.db:
+            self.db.executemany('DELETE FROM files WHERE path = ?', removed)
+        return len(changed), len(seen) - len(changed), len(removed)
+
+    def query(self, root: str = '.', recursive: bool = True, min_bpm=None, max_bpm=None,
+              program=None, pitch_above=None, pitch_below=None, min_notes=None, name=None):
+        """
+        Rows (path, bpm, duration, tracks, programs) under `root`, sorted by path.
+
+        With `program`, the pitch and note-count filters apply to that
+        program's notes ("has program 107 with notes above 84"); without it
+        they apply to the whole file. Pitch bounds are exclusive.
+        """
+        root = os.path.abspath(root)
+        prefix = root.rstrip(os.sep) + os.sep
+        sql = ['SELECT path, bpm, duration, tracks, programs FROM files WHERE substr(path, 1, ?) = ?']
+        args = [len(prefix), prefix]
+        if not recursive:
+            sql.append("AND instr(substr(path, ?), ?) = 0")
+            args += [len(prefix) + 1, os.sep]
+        if min_bpm is not None:
+            sql.append('AND bpm >= ?')
+            args.append(min_bpm)
+        if max_bpm is not None:
+            sql.append('AND bpm <= ?')
+            args.append(max_bpm)
+        if name:
+            sql.append('AND lower(path) LIKE ?')
+            args.append(f'%{name.lower()}%')
+
+        content, content_args = [], []
+        if program is not None:
+            content.append('program = ?')
+            content_args.append(program)
+        if pitch_above is not None:
+            content.append('max_pitch > ?')
+            content_args.append(pitch_above)
+        if pitch_below is not None:
+            content.append('min_pitch < ?')
+            content_args.append(pitch_below)
+        if min_notes is not None:
+            content.append('notes >= ?')
+            content_args.append(min_notes)
+        if program is not None:
+            sql.append('AND path IN (SELECT path FROM file_programs WHERE ' + ' AND '.join(content) + ')')
+        elif content:
+            sql.append('AND ' + ' AND '.join(content))
+        args += content_args
+        sql.append('ORDER BY path')
+        return self.db.execute(' '.join(sql), args).fetchall()
+
+    def details(self, path: str):
+        """(summary row, [(program, notes, min_pitch, max_pitch), ...]) for one indexed file."""
+        path = os.path.abspath(path)
+        summary = self.db.execute(
+            'SELECT bpm, min_bpm, max_bpm, tempo_changes, duration, tracks, notes, min_pitch, max_pitch '
+            'FROM files WHERE path = ?', (path,)).fetchone()
+        programs = self.db.execute(
+            'SELECT program, notes, min_pitch, max_pitch FROM file_programs WHERE path = ? ORDER BY program',
+            (path,)).fetchall()
+        return summary, programs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index a MIDI library and search it by content.")
+    parser.add_argument('root', nargs='?', default='.')
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help="SQLite index file")
+    parser.add_argument('--bpm', nargs=2, type=float, metavar=('MIN', 'MAX'), help="starting BPM range")
+    parser.add_argument('--program', type=int, help="only files using this program (128 = drums)")
+    parser.add_argument('--above', type=parse_pitch, metavar='PITCH',
+                        help="with notes above this pitch (number or name, e.g. C6)")
+    parser.add_argument('--below', type=parse_pitch, metavar='PITCH', help="with notes below this pitch")
+    parser.add_argument('--min-notes', type=int)
+    parser.add_argument('--name', help="filename substring")
+    parser.add_argument('-j', '--workers', type=int, help="scan processes (default: all cores)")
+    parser.add_argument('--details', action='store_true', help="print each match's program histogram")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with MidiIndex(args.index) as index:
+        scanned, unchanged, removed = index.refresh(args.root, workers=args.workers)
+        indexed = time.perf_counter()
+        rows = index.query(args.root, min_bpm=args.bpm[0] if args.bpm else None,
+                           max_bpm=args.bpm[1] if args.bpm else None, program=args.program,
+                           pitch_above=args.above, pitch_below=args.below,
+                           min_notes=args.min_notes, name=args.name)
+        queried = time.perf_counter()
+        for path, bpm, duration, tracks, programs in rows:
+            if bpm is None:
+                print(f"{os.path.relpath(path, args.root)}  (unreadable)")
+                continue
+            print(f"{os.path.relpath(path, args.root)}  {bpm:.1f} BPM  {duration:.1f}s  "
+                  f"{tracks} tracks  programs: {programs}")
+            if args.details:
+                summary, histogram = index.details(path)
+                print(f"    tempo {summary[1]:.1f}-{summary[2]:.1f} BPM ({summary[3]} changes), "
+                      f"{summary[6]} notes, pitch {summary[7]}-{summary[8]}")
+                for program, notes, low, high in histogram:
+                    print(f"    program {program:3d}: {notes:5d} notes, pitch {low}-{high}")
+    print(f"{len(rows)} files ({scanned} scanned, {unchanged} unchanged, {removed} removed); "
+          f"index {indexed - start:.3f}s, query {(queried - indexed) * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
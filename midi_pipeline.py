@@ -0,0 +1,60 @@
+# midi_pipeline.py - Parse once, run every processing stage in memory, save once
+
+import numpy as np
+
+from midi_events import MidiEventTable
+from midi_humanizer import humanize_events, swing_events
+
+
+class MidiPipeline:
+    """
+    Ordered list of stages that all work on the same MidiEventTable.
+
+    A stage is any callable taking the table and modifying it in place (or
+    returning a replacement table). Built-in stages can be chained:
+
+        MidiPipeline().humanize(seed=1).transpose(2).run('in.mid', 'out.mid')
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    def add(self, stage, name: str = None):
+        """Append a user-defined stage."""
+        self.stages.append((name or getattr(stage, '__name__', 'stage'), stage))
+        return self
+
+    def humanize(self, timing_jitter_ms: float = 10, velocity_jitter: int = 8,
+                 swing: float = 0.1, seed: int = None, swing_grid: str = '8th'):
+        # A fresh generator per run, so a seeded pipeline repeats its output
+        return self.add(lambda events: humanize_events(events, timing_jitter_ms,
+                                                       velocity_jitter, swing,
+                                                       rng=np.random.default_rng(seed),
+                                                       swing_grid=swing_grid),
+                        'humanize')
+
+    def swing(self, ratio: float = 0.6, grid: str = '8th'):
+        return self.add(lambda events: swing_events(events, ratio, grid), 'swing')
+
+    def transpose(self, semitones: int):
+        return self.add(lambda events: events.transpose(semitones), 'transpose')
+
+    def scale_velocity(self, factor: float):
+        return self.add(lambda events: events.scale_velocity(factor), 'velocity_scale')
+
+    def time_stretch(self, factor: float):
+        return self.add(lambda events: events.time_stretch(factor), 'time_stretch')
+
+    def run_events(self, events: MidiEventTable) -> MidiEventTable:
+        """Run every stage over an already loaded table."""
+        for _, stage in self.stages:
+            result = stage(events)
+            if isinstance(result, MidiEventTable):
+                events = result
+        return events
+
+    def run(self, midi_in: str, midi_out: str) -> MidiEventTable:
+        """Parse `midi_in`, run all stages and write `midi_out`."""
+        events = self.run_events(MidiEventTable.from_path(midi_in))
+        events.save(midi_out)
+        return events
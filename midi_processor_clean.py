@@ -1,52 +1,36 @@
 # midi_processor.py - MIDI-only version (no audio dependencies)
 
 import mido
-import tempfile
 import os
-import random
+import numpy as np
+
+from midi_events import MidiEventTable
+from midi_humanizer import humanize_events
+from midi_pipeline import MidiPipeline
+from midi_renderer import OfflineRenderer, write_wav
 
 class MidiProcessor:
     """MIDI-only processor that focuses on humanization and MIDI effects."""
     
-    def __init__(self):
+    def __init__(self, verbose=True):
         """Initialize without FluidSynth or audio dependencies."""
-        print("MIDI Processor initialized (audio-free mode)")
+        self.verbose = verbose
+        if verbose:
+            print("MIDI Processor initialized (audio-free mode)")
     
     def humanize_midi(self, midi_in: str, midi_out: str,
                       timing_jitter_ms: float = 10,
                       velocity_jitter: int = 8,
-                      swing: float = 0.1):
+                      swing: float = 0.1,
+                      seed: int = None):
         """
         Add timing & velocity humanization and swing to a MIDI file.
+        Pass a seed for reproducible output.
         """
-        mid = mido.MidiFile(midi_in)
-        ticks_per_beat = mid.ticks_per_beat
-        
-        for track_idx, track in enumerate(mid.tracks):
-            abs_time = 0
-            for msg in track:
-                abs_time += msg.time
-                if msg.type in ('note_on', 'note_off'):
-                    # Calculate jitter
-                    tempo_factor = 120  # Assume 120 BPM as default
-                    jitter_ticks = int(timing_jitter_ms * ticks_per_beat / (60000 / tempo_factor))
-                    
-                    # Apply timing jitter
-                    jitter = random.randint(-jitter_ticks, jitter_ticks)
-                    msg.time = max(0, msg.time + jitter)  # Ensure time doesn't go negative
-                    
-                    # Apply velocity jitter for note_on messages
-                    if msg.type == 'note_on' and hasattr(msg, 'velocity'):
-                        velocity_change = random.randint(-velocity_jitter, velocity_jitter)
-                        msg.velocity = max(1, min(127, msg.velocity + velocity_change))
-                    
-                    # Apply swing: delay every other 8th note
-                    if swing > 0 and ticks_per_beat > 0:
-                        eighth_note = ticks_per_beat // 2
-                        if eighth_note > 0 and (abs_time // eighth_note) % 2:
-                            msg.time += int(swing * ticks_per_beat)
-        
-        mid.save(midi_out)
+        events = MidiEventTable.from_path(midi_in)
+        humanize_events(events, timing_jitter_ms, velocity_jitter, swing,
+                        rng=np.random.default_rng(seed))
+        events.save(midi_out)
     
     def apply_midi_effects(self, midi_in: str, midi_out: str,
                           transpose: int = 0,
@@ -55,27 +39,14 @@ class MidiProcessor:
         """
         Apply various MIDI effects like transpose, velocity scaling, time stretching.
         """
-        mid = mido.MidiFile(midi_in)
+        events = MidiEventTable.from_path(midi_in)
         
-        for track in mid.tracks:
-            for msg in track:
-                # Apply time stretching
-                if hasattr(msg, 'time'):
-                    msg.time = int(msg.time * time_stretch)
-                
-                # Apply transpose and velocity scaling to note messages
-                if msg.type in ('note_on', 'note_off'):
-                    # Transpose
-                    if hasattr(msg, 'note'):
-                        new_note = msg.note + transpose
-                        msg.note = max(0, min(127, new_note))
-                    
-                    # Velocity scaling
-                    if msg.type == 'note_on' and hasattr(msg, 'velocity'):
-                        new_velocity = int(msg.velocity * velocity_scale)
-                        msg.velocity = max(1, min(127, new_velocity))
+        # Each effect runs over whole columns rather than message by message
+        events.time_stretch(time_stretch)
+        events.transpose(transpose)
+        events.scale_velocity(velocity_scale)
         
-        mid.save(midi_out)
+        events.save(midi_out)
     
     def combine_midi_files(self, midi_files: list, output_file: str, 
                           channel_assignments: list = None):
@@ -129,31 +100,57 @@ class MidiProcessor:
         print(f"Combined MIDI saved to: {output_file}")
         return True
     
+    def render_audio(self, events, wav_out: str, soundfont=None, sample_rate=44100):
+        """Render an event table to WAV with the offline SoundFont renderer (.sf2 path required)."""
+        if soundfont is None:
+            raise ValueError("Rendering audio needs a SoundFont: pass soundfont='path/to/bank.sf2'")
+        renderer = OfflineRenderer(soundfont, sample_rate)
+        audio = renderer.render_events(events)
+        write_wav(wav_out, audio, sample_rate)
+        if self.verbose:
+            print(f"✓ Rendered audio saved to: {wav_out}")
+    
     def process_midi_complete(self, midi_in: str, midi_out: str,
                              timing_jitter_ms=10, velocity_jitter=8, swing=0.1,
-                             transpose=0, velocity_scale=1.0, time_stretch=1.0):
+                             transpose=0, velocity_scale=1.0, time_stretch=1.0,
+                             seed=None, extra_stages=None,
+                             wav_out=None, soundfont=None):
         """
         Complete MIDI processing pipeline with humanization and effects.
+        The file is parsed once and every stage (including any callables in
+        extra_stages) runs on the same in-memory events before one save.
+        If wav_out is given, the result is also rendered to audio; that needs
+        an explicit soundfont (.sf2 path), and a ValueError is raised before
+        any processing if it is missing.
         """
-        print(f"Processing MIDI file: {midi_in}")
-        
-        # Step 1: Apply humanization
-        with tempfile.NamedTemporaryFile(suffix=".mid", delete=False) as temp_midi:
-            humanized_mid = temp_midi.name
+        if wav_out and soundfont is None:
+            raise ValueError("wav_out needs a SoundFont: pass soundfont='path/to/bank.sf2'")
+        if self.verbose:
+            print(f"Processing MIDI file: {midi_in}")
         
-        self.humanize_midi(midi_in, humanized_mid, timing_jitter_ms, velocity_jitter, swing)
-        print("✓ Applied humanization effects")
+        pipeline = (MidiPipeline()
+                    .humanize(timing_jitter_ms, velocity_jitter, swing, seed)
+                    .transpose(transpose)
+                    .scale_velocity(velocity_scale)
+                    .time_stretch(time_stretch))
+        for stage in extra_stages or []:
+            pipeline.add(stage)
         
-        # Step 2: Apply additional MIDI effects
-        self.apply_midi_effects(humanized_mid, midi_out, transpose, velocity_scale, time_stretch)
-        print("✓ Applied MIDI effects")
+        events = pipeline.run(midi_in, midi_out)
+        if self.verbose:
+            print("✓ Applied humanization effects")
+            print("✓ Applied MIDI effects")
         
-        # Clean up temporary file
-        if os.path.exists(humanized_mid):
-            os.unlink(humanized_mid)
+        if wav_out:
+            self.render_audio(events, wav_out, soundfont)
+        if not self.verbose:
+            return
         
         print(f"✓ Complete! Processed MIDI saved to: {midi_out}")
+        if wav_out:
+            return
         print("\nTo convert to audio:")
+        print("0. Pass wav_out=... (or run midi_renderer.py) with a .sf2 SoundFont")
         print("1. Use a DAW like Reaper, FL Studio, or Logic Pro")
         print("2. Use online MIDI to WAV converters")
         print("3. Install FluidSynth + SoundFont for audio conversion")
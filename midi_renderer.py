@@ -0,0 +1,373 @@
+# midi_renderer.py - Offline MIDI -> WAV rendering with a SoundFont, in pure NumPy
+
+import argparse
+import os
+import sys
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from midi_events import MidiEventTable, CONTROL_CHANGE, PROGRAM_CHANGE
+from soundfont import (SoundFont,
+                       GEN_PAN, GEN_INITIAL_ATTENUATION, GEN_COARSE_TUNE, GEN_FINE_TUNE,
+                       GEN_SCALE_TUNING, GEN_ATTACK_VOL_ENV, GEN_HOLD_VOL_ENV,
+                       GEN_DECAY_VOL_ENV, GEN_SUSTAIN_VOL_ENV, GEN_RELEASE_VOL_ENV)
+from tempo_map import TempoMap
+
+DRUM_CHANNEL = 9
+DRUM_BANK = 128
+MAX_RELEASE_SECONDS = 5.0  # cap on release tails so a bad SoundFont can't balloon a render
+
+
+def timecents_to_seconds(timecents):
+    return 2.0 ** (timecents / 1200.0)
+
+
+def centibels_to_gain(centibels):
+    return 10.0 ** (-centibels / 200.0)
+
+
+def write_wav(path: str, audio, sample_rate: int):
+    """Write float stereo audio (frames x 2) as 16-bit PCM, scaling down only if it would clip."""
+    peak = float(np.max(np.abs(audio))) if audio.size else 0.0
+    if peak > 1.0:
+        audio = audio / peak
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(pcm.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+
+class NoteList:
+    """Flat arrays describing every note to render, with the channel state at its onset."""
+
+    def __init__(self, events: MidiEventTable, tempo_map: TempoMap = None):
+        if tempo_map is None:
+            tempo_map = TempoMap.from_event_table(events)
+        on_rows, off_rows = events.note_pairs()
+        order = np.lexsort((on_rows, events.tick[on_rows]))
+        on_rows, off_rows = on_rows[order], off_rows[order]
+
+        self.channel = events.channel[on_rows].astype(np.int64)
+        self.key = events.pitch[on_rows].astype(np.int64)
+        self.velocity = events.velocity[on_rows].astype(np.int64)
+        self.start = tempo_map.ticks_to_seconds(events.tick[on_rows])
+        self.end = tempo_map.ticks_to_seconds(events.tick[off_rows])
+        self.tick = ticks = events.tick[on_rows]
+
+        self.program = _state_at(events, PROGRAM_CHANGE, None, self.channel, ticks, 0)
+        self.bank = _state_at(events, CONTROL_CHANGE, 0, self.channel, ticks, 0)
+        self.bank[self.channel == DRUM_CHANNEL] = DRUM_BANK
+        self.volume = _state_at(events, CONTROL_CHANGE, 7, self.channel, ticks, 100)
+        self.expression = _state_at(events, CONTROL_CHANGE, 11, self.channel, ticks, 127)
+        self.pan = _state_at(events, CONTROL_CHANGE, 10, self.channel, ticks, 64)
+
+    def __len__(self):
+        return len(self.key)
+
+    def subset(self, indices):
+        """New NoteList holding only the given notes, in that order."""
+        notes = NoteList.__new__(NoteList)
+        notes.__dict__.update({name: column[indices] for name, column in self.__dict__.items()})
+        return notes
+
+
+def _state_at(events, type_code, controller, channels, ticks, default):
+    """
+    Value of a program or controller in effect on each note's channel at its tick.
+
+    Vectorized: state events are sorted by (channel, tick) and each note
+    binary-searches its own (channel, tick) key.
+    """
+    mask = events.type == type_code
+    if controller is not None:
+        mask &= events.pitch == controller
+    rows = np.flatnonzero(mask)
+    values = events.pitch[rows] if controller is None else events.velocity[rows]
+    result = np.full(len(channels), default, dtype=np.int64)
+    if len(rows) == 0:
+        return result
+
+    span = int(max(events.tick.max(), ticks.max() if len(ticks) else 0)) + 1
+    state_keys = events.channel[rows].astype(np.int64) * span + events.tick[rows]
+    order = np.argsort(state_keys, kind='stable')
+    state_keys, values = state_keys[order], values[order]
+    note_keys = channels * span + ticks
+    pos = np.searchsorted(state_keys, note_keys, side='right') - 1
+    found = (pos >= 0) & (state_keys[np.maximum(pos, 0)] // span == channels)
+    result[found] = values[pos[found]]
+    return result
+
+
+class OfflineRenderer:
+    """
+    Renders notes from a MidiEventTable through a SoundFont.
+
+    Each voice is generated as one vectorized block (resampling by
+    interpolation, looping by modular index wrap, envelope by array math)
+    and summed into the output buffer.
+    """
+
+    def __init__(self, soundfont, sample_rate: int = 44100):
+        if soundfont is None:
+            raise ValueError("OfflineRenderer needs a SoundFont (.sf2 path or SoundFont object)")
+        if isinstance(soundfont, str):
+            soundfont = SoundFont(soundfont)
+        self.soundfont = soundfont
+        self.sample_rate = sample_rate
+
+    def render_events(self, events: MidiEventTable, tempo_map: TempoMap = None, jobs: int = 1):
+        """
+        Render a whole event table to float32 stereo (frames x 2).
+
+        Channels are rendered as separate stems and summed in channel order,
+        so jobs > 1 (one process per stem) gives bit-identical output.
+        """
+        notes = NoteList(events, tempo_map)
+        if jobs > 1:
+            return render_parallel(self, notes, jobs)[2]
+        return self.render_mix(notes)
+
+    def render_mix(self, notes: NoteList):
+        """Single-process mixdown: one stem buffer reused per channel, summed in channel order."""
+        length = self.render_length(notes)
+        mix = np.zeros((length, 2), dtype=np.float32)
+        stem = np.empty_like(mix)
+        for channel in self.stem_channels(notes):
+            stem.fill(0)
+            self.render_notes(notes, np.flatnonzero(notes.channel == channel), stem)
+            mix += stem
+        return mix
+
+    def stem_channels(self, notes: NoteList):
+        """Channels that have notes, in mixdown order."""
+        return [int(channel) for channel in np.unique(notes.channel)]
+
+    def render_length(self, notes: NoteList, indices=None):
+        """Frames needed to hold every voice of the selected notes, tails included."""
+        if indices is None:
+            indices = range(len(notes))
+        length = 0
+        for i in indices:
+            key = int(notes.key[i])
+            start = int(round(notes.start[i] * self.sample_rate))
+            hold = max(notes.end[i] - notes.start[i], 0.0)
+            for voice in self.soundfont.voices(int(notes.bank[i]), int(notes.program[i]),
+                                               key, int(notes.velocity[i])):
+                length = max(length, start + self._voice_frames(voice, key, hold)[0])
+        return length
+
+    def render_notes(self, notes: NoteList, indices, out=None, offset: int = 0):
+        """
+        Mix the selected notes, in order, into `out` (allocated if not given).
+        `out` starts at frame `offset` of the song; notes must not start before it.
+        """
+        if out is None:
+            out = np.zeros((self.render_length(notes, indices) - offset, 2), dtype=np.float32)
+        length = len(out)
+        for i in indices:
+            for start, block in self._render_note(notes, i):
+                start -= offset
+                stop = min(start + len(block), length)
+                if stop > start:
+                    out[start:stop] += block[:stop - start]
+        return out
+
+    def _render_note(self, notes: NoteList, i):
+        key, velocity = int(notes.key[i]), int(notes.velocity[i])
+        voices = self.soundfont.voices(int(notes.bank[i]), int(notes.program[i]), key, velocity)
+        start = int(round(notes.start[i] * self.sample_rate))
+        hold = max(notes.end[i] - notes.start[i], 0.0)
+
+        channel_gain = ((notes.volume[i] / 127.0) ** 2) * ((notes.expression[i] / 127.0) ** 2)
+        velocity_gain = (velocity / 127.0) ** 2
+        channel_pan = (notes.pan[i] - 64) / 64.0 * 500.0
+        for voice in voices:
+            block = self._render_voice(voice, key, hold)
+            if block is None:
+                continue
+            g = voice.generators
+            gain = channel_gain * velocity_gain * centibels_to_gain(g[GEN_INITIAL_ATTENUATION])
+            pan = np.clip(g[GEN_PAN] + channel_pan, -500, 500)
+            angle = (pan + 500.0) / 1000.0 * (np.pi / 2)
+            stereo = np.empty((len(block), 2), dtype=np.float32)
+            stereo[:, 0] = block * (gain * np.cos(angle))
+            stereo[:, 1] = block * (gain * np.sin(angle))
+            yield start, stereo
+
+    def _voice_frames(self, voice, key, hold_seconds):
+        """(frames, resampling step) for one voice; frames is 0 if it is silent."""
+        g = voice.generators
+        semitones = ((key - voice.root_key) * g[GEN_SCALE_TUNING] / 100.0
+                     + g[GEN_COARSE_TUNE] + (g[GEN_FINE_TUNE] + voice.pitch_correction) / 100.0)
+        step = 2.0 ** (semitones / 12.0) * voice.sample_rate / self.sample_rate
+
+        release = min(timecents_to_seconds(g[GEN_RELEASE_VOL_ENV]), MAX_RELEASE_SECONDS)
+        frames = int((hold_seconds + release) * self.sample_rate)
+        sample_length = voice.end - voice.start
+        if frames <= 0 or sample_length <= 1:
+            return 0, step
+        if not voice.looping:
+            frames = min(frames, int((sample_length - 1) / step))
+        return max(frames, 0), step
+
+    def _render_voice(self, voice, key, hold_seconds):
+        """Mono float32 block for one voice: resampled sample times envelope."""
+        g = voice.generators
+        frames, step = self._voice_frames(voice, key, hold_seconds)
+        if frames <= 0:
+            return None
+        sample_length = voice.end - voice.start
+
+        positions = np.arange(frames, dtype=np.float64) * step
+        if voice.looping:
+            loop_start = voice.loop_start - voice.start
+            loop_length = voice.loop_end - voice.loop_start
+            wrapped = positions >= loop_start
+            positions[wrapped] = loop_start + np.mod(positions[wrapped] - loop_start, loop_length)
+
+        data = self.soundfont.sample_data(voice.start, voice.end)
+        block = np.interp(positions, np.arange(sample_length), data).astype(np.float32)
+        block *= self._envelope(g, frames, hold_seconds)
+        return block
+
+    def _envelope(self, g, frames, hold_seconds):
+        """DAHDSR-style volume envelope (attack linear, decay/release in dB)."""
+        sr = self.sample_rate
+        t = np.arange(frames, dtype=np.float64) / sr
+        attack = timecents_to_seconds(g[GEN_ATTACK_VOL_ENV])
+        hold = timecents_to_seconds(g[GEN_HOLD_VOL_ENV])
+        decay = timecents_to_seconds(g[GEN_DECAY_VOL_ENV])
+        release = timecents_to_seconds(g[GEN_RELEASE_VOL_ENV])
+        sustain_cb = min(max(g[GEN_SUSTAIN_VOL_ENV], 0), 1440)
+
+        env = np.minimum(t / attack, 1.0) if attack > 0 else np.ones(frames)
+        decay_start = attack + hold
+        decaying = t > decay_start
+        progress = np.minimum((t[decaying] - decay_start) / decay, 1.0)
+        env[decaying] = centibels_to_gain(progress * sustain_cb)
+
+        released = t >= hold_seconds
+        if np.any(released):
+            first = int(np.argmax(released))
+            level = env[first]
+            # SF2 release time is the time to fall 100 dB
+            env[released] = level * centibels_to_gain((t[released] - hold_seconds) / release * 1000.0)
+        return env.astype(np.float32)
+
+    def render_file(self, midi_in: str, wav_out: str, jobs: int = 1, stems_dir: str = None):
+        """
+        Render a .mid file to a 16-bit stereo WAV. Returns the audio length in seconds.
+        With stems_dir, each channel is also written as its own WAV.
+        """
+        notes = NoteList(MidiEventTable.from_path(midi_in))
+        if jobs > 1 or stems_dir:
+            channels, stems, audio = render_parallel(self, notes, jobs)
+            if stems_dir:
+                os.makedirs(stems_dir, exist_ok=True)
+                base = os.path.splitext(os.path.basename(midi_in))[0]
+                for channel, stem in zip(channels, stems):
+                    write_wav(os.path.join(stems_dir, f"{base}_ch{channel + 1:02d}.wav"),
+                              stem, self.sample_rate)
+        else:
+            audio = self.render_mix(notes)
+        write_wav(wav_out, audio, self.sample_rate)
+        return len(audio) / self.sample_rate
+
+
+# ----------------------------------------------------------------------
+# Parallel rendering: one stem per channel, each worker writes into a
+# shared-memory slot and the parent sums the slots in channel order.
+# ----------------------------------------------------------------------
+
+_worker_renderer = None
+
+
+def _init_stem_worker(soundfont_path, sample_rate):
+    global _worker_renderer
+    _worker_renderer = OfflineRenderer(soundfont_path, sample_rate)
+
+
+def _render_stem_job(job):
+    notes, shm_name, shape, slot = job
+    shm = shared_memory.SharedMemory(name=shm_name)
+    stems = None
+    try:
+        stems = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        _worker_renderer.render_notes(notes, range(len(notes)), stems[slot])
+    finally:
+        # The view must be gone before close(), or close() raises BufferError
+        # and hides the render error
+        del stems
+        shm.close()
+    return slot
+
+
+def render_parallel(renderer: OfflineRenderer, notes: NoteList, jobs: int = None):
+    """
+    Render every channel's stem in a process pool over shared memory.
+
+    Returns (channels, stems, mix); stems is a copy owned by the caller and
+    mix is summed in channel order, matching OfflineRenderer.render_events.
+    """
+    channels = renderer.stem_channels(notes)
+    length = renderer.render_length(notes)
+    shape = (len(channels), length, 2)
+    nbytes = max(int(np.prod(shape)) * 4, 1)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    stems = None
+    try:
+        stems = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        stems.fill(0)
+        # Each job only carries its own channel's notes
+        job_list = [(notes.subset(np.flatnonzero(notes.channel == channel)), shm.name, shape, slot)
+                    for slot, channel in enumerate(channels)]
+        workers = max(1, min(jobs or os.cpu_count() or 1, len(job_list)))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_stem_worker,
+                                 initargs=(renderer.soundfont.path, renderer.sample_rate)) as executor:
+            for _ in executor.map(_render_stem_job, job_list):
+                pass
+
+        mix = np.zeros((length, 2), dtype=np.float32)
+        for slot in range(len(channels)):
+            mix += stems[slot]
+        stems_copy = stems.copy()
+    finally:
+        del stems
+        shm.close()
+        shm.unlink()
+    return channels, stems_copy, mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a MIDI file to WAV using a SoundFont.")
+    parser.add_argument('midi_in')
+    parser.add_argument('wav_out')
+    parser.add_argument('--soundfont', required=True, help=".sf2 SoundFont to render with")
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="render channel stems in this many processes")
+    parser.add_argument('--stems', metavar='DIR', help="also write one WAV per channel into DIR")
+    args = parser.parse_args(argv)
+
+    try:
+        renderer = OfflineRenderer(args.soundfont, args.sample_rate)
+    except (OSError, ValueError) as e:
+        print(f"Error loading SoundFont: {e}")
+        return 1
+
+    start = time.perf_counter()
+    seconds = renderer.render_file(args.midi_in, args.wav_out, args.jobs, args.stems)
+    elapsed = time.perf_counter() - start
+    speed = seconds / elapsed if elapsed > 0 else float('inf')
+    print(f"Rendered {seconds:.1f}s of audio to {args.wav_out} in {elapsed:.2f}s ({speed:.1f}x real time)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
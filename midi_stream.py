@@ -0,0 +1,324 @@
+# midi_stream.py - Lazy, memory-mapped Standard MIDI File reader yielding merged timed events
+
+import heapq
+import mmap
+import struct
+
+from tempo_map import TempoMap, DEFAULT_TEMPO
+
+META = 0xFF
+SYSEX = 0xF0
+SYSEX_ESCAPE = 0xF7
+META_SET_TEMPO = 0x51
+META_END_OF_TRACK = 0x2F
+
+
+class MidiStreamError(ValueError):
+    """Raised for data that is not a readable Standard MIDI File."""
+
+
+def _read_varlen(data, pos):
+    """Decode a variable-length quantity at `pos`; returns (value, next position)."""
+    value = 0
+    for _ in range(4):
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+    raise MidiStreamError(f"Variable-length value too long at byte {pos}")
+
+
+def _write_varlen(out, value):
+    """Append `value` to bytearray `out` as a variable-length quantity."""
+    if value > 0x0FFFFFFF:
+        raise MidiStreamError(f"Delta time {value} does not fit a variable-length value")
+    shift = 21
+    while shift and not value >> shift:
+        shift -= 7
+    while shift:
+        out.append(0x80 | ((value >> shift) & 0x7F))
+        shift -= 7
+    out.append(value & 0x7F)
+
+
+def _message_length(status):
+    """Data bytes after a channel status byte."""
+    return 1 if 0xC0 <= status < 0xE0 else 2
+
+
+class MidiStream:
+    """
+    Reads a .mid file through mmap without building a mido object graph.
+
+    Opening the file only parses the 14-byte header and the chunk headers.
+    Each track is decoded by its own cursor (a generator walking the mapped
+    bytes, running status included), and events() merges the cursors with a
+    heap keyed on (tick, track), so events come out in playback order one at
+    a time. Memory stays constant however long the file is.
+
+    Messages are bytes: channel messages are the full status + data bytes
+    (running status expanded), meta events are 0xFF, type, payload, and
+    sysex events are 0xF0/0xF7 followed by the payload.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file cannot be mapped
+            self._file.close()
+            raise MidiStreamError(f"{path} is empty")
+        try:
+            self._parse_header()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _parse_header(self):
+        data = self._map
+        if len(data) < 14 or data[:4] != b'MThd':
+            raise MidiStreamError(f"{self.path} is not a MIDI file (missing MThd header)")
+        header_length, self.midi_type, declared_tracks, division = struct.unpack_from('>IHHh', data, 4)
+        if division <= 0:
+            raise MidiStreamError(f"{self.path} uses SMPTE timing, which is not supported")
+        self.ticks_per_beat = division
+
+        # (start, end) of every MTrk body; other chunk types are skipped
+        self.track_spans = []
+        pos = 8 + header_length
+        while pos + 8 <= len(data):
+            chunk_id = data[pos:pos + 4]
+            length, = struct.unpack_from('>I', data, pos + 4)
+            start, end = pos + 8, min(pos + 8 + length, len(data))
+            if chunk_id == b'MTrk':
+                self.track_spans.append((start, end))
+            pos = end
+        self.num_tracks = len(self.track_spans)
+        if self.num_tracks < declared_tracks:
+            print(f"Warning: {self.path} declares {declared_tracks} tracks but contains {self.num_tracks}")
+
+    # ------------------------------------------------------------------
+    # Track cursors
+    # ------------------------------------------------------------------
+
+    def track_events(self, track: int):
+        """Yield (abs_tick, message bytes) for one track, in file order."""
+        data = self._map
+        pos, end = self.track_spans[track]
+        tick = 0
+        running = None
+        while pos < end:
+            delta, pos = _read_varlen(data, pos)
+            tick += delta
+            status = data[pos]
+            if status < 0x80:
+                if running is None:
+                    raise MidiStreamError(f"Data byte without status in track {track} at byte {pos}")
+                status = running
+            else:
+                pos += 1
+
+            if status == META:
+                kind = data[pos]
+                length, pos = _read_varlen(data, pos + 1)
+                yield tick, bytes((META, kind)) + data[pos:pos + length]
+                pos += length
+                if kind == META_END_OF_TRACK:
+                    return
+            elif status == SYSEX or status == SYSEX_ESCAPE:
+                length, pos = _read_varlen(data, pos)
+                yield tick, bytes((status,)) + data[pos:pos + length]
+                pos += length
+            elif status < 0xF0:
+                length = _message_length(status)
+                yield tick, bytes((status,)) + data[pos:pos + length]
+                pos += length
+                running = status
+            else:
+                raise MidiStreamError(f"Unexpected status 0x{status:02X} in track {track} at byte {pos}")
+
+    def _keyed_track(self, track: int):
+        for tick, message in self.track_events(track):
+            yield tick, track, message
+
+    def events(self):
+        """
+        Yield (abs_tick, seconds, track, message bytes) for every event in
+        merged order: by tick, ties by track then by position in the track.
+        Seconds follow set_tempo events as they stream past (only track 0's
+        in type 2 files, where tracks are independent songs).
+        """
+        seconds_per_tick = DEFAULT_TEMPO / 1e6 / self.ticks_per_beat
+        segment_tick, segment_seconds = 0, 0.0
+        cursors = [self._keyed_track(track) for track in range(self.num_tracks)]
+        for tick, track, message in heapq.merge(*cursors, key=lambda event: (event[0], event[1])):
+            seconds = segment_seconds + (tick - segment_tick) * seconds_per_tick
+            yield tick, seconds, track, message
+            if (message[0] == META and message[1] == META_SET_TEMPO and len(message) >= 5
+                    and (self.midi_type != 2 or track == 0)):
+                segment_tick, segment_seconds = tick, seconds
+                tempo = (message[2] << 16) | (message[3] << 8) | message[4]
+                seconds_per_tick = tempo / 1e6 / self.ticks_per_beat
+
+    def channel_messages(self):
+        """Yield (seconds, status, data1, data2) for channel messages only, in merged order."""
+        for _, seconds, _, message in self.events():
+            if message[0] < 0xF0:
+                yield seconds, message[0], message[1], message[2] if len(message) > 2 else 0
+
+    # ------------------------------------------------------------------
+    # Timing summary
+    # ------------------------------------------------------------------
+
+    def scan_timing(self):
+        """
+        (TempoMap, end_tick) from one pass that reads delta times, status
+        bytes and tempo metas; other payloads are skipped over.
+        """
+        tempo_map, end_tick, _, _ = self.scan_summary()
+        return tempo_map, end_tick
+
+    def scan_summary(self):
+        """
+        (TempoMap, end_tick, notes, program_changes) in the same skipping
+        pass. `notes` holds (tick, channel, pitch) for every sounding note-on
+        and `program_changes` (tick, channel, program), each in track order.
+        """
+        data = self._map
+        changes = []
+        end_tick = 0
+        notes = []
+        program_changes = []
+        tracks = range(min(self.num_tracks, 1)) if self.midi_type == 2 else range(self.num_tracks)
+        for track in range(self.num_tracks):
+            pos, end = self.track_spans[track]
+            tick = 0
+            running = None
+            while pos < end:
+                delta, pos = _read_varlen(data, pos)
+                tick += delta
+                status = data[pos]
+                if status < 0x80:
+                    if running is None:
+                        raise MidiStreamError(f"Data byte without status in track {track} at byte {pos}")
+                    status = running
+                else:
+                    pos += 1
+                if status == META:
+                    kind = data[pos]
+                    length, pos = _read_varlen(data, pos + 1)
+                    if kind == META_SET_TEMPO and length >= 3 and track in tracks:
+                        changes.append((tick, (data[pos] << 16) | (data[pos + 1] << 8) | data[pos + 2]))
+                    pos += length
+                    if kind == META_END_OF_TRACK:
+                        break
+                elif status == SYSEX or status == SYSEX_ESCAPE:
+                    length, pos = _read_varlen(data, pos)
+                    pos += length
+                elif status < 0xF0:
+                    kind = status & 0xF0
+                    if kind == 0x90 and data[pos + 1]:
+                        notes.append((tick, status & 0x0F, data[pos]))
+                    elif kind == 0xC0:
+                        program_changes.append((tick, status & 0x0F, data[pos]))
+                    pos += _message_length(status)
+                    running = status
+                else:
+                    raise MidiStreamError(f"Unexpected status 0x{status:02X} in track {track} at byte {pos}")
+            end_tick = max(end_tick, tick)
+        return TempoMap(self.ticks_per_beat, changes), end_tick, notes, program_changes
+
+
+def filter_control_changes(input_path, output_path, control=None, channel=None, min_value=0, max_value=127):
+    """
+    Copy a MIDI file, dropping control changes that match `control` and
+    `channel` (a number, a list of numbers, or None for any) with a value in
+    [min_value, max_value]. Works on the raw bytes: kept events are copied
+    as they are, a dropped event's delta time is added to the next kept
+    event so nothing moves, and a status byte is written back where a kept
+    event relied on the running status of a dropped one. Other chunks and
+    the header are copied unchanged. Returns how many events were dropped.
+    """
+    controls = None if control is None else set([control] if isinstance(control, int) else control)
+    channels = None if channel is None else set([channel] if isinstance(channel, int) else channel)
+    dropped = 0
+    with MidiStream(input_path) as stream, open(output_path, 'wb') as out:
+        data = stream._map
+        header_end = 8 + struct.unpack_from('>I', data, 4)[0]
+        out.write(data[:header_end])
+        spans = dict(stream.track_spans)
+        pos = header_end
+        while pos + 8 <= len(data):
+            start = pos + 8
+            end = min(start + struct.unpack_from('>I', data, pos + 4)[0], len(data))
+            if data[pos:pos + 4] != b'MTrk' or start not in spans:
+                out.write(data[pos:end])
+                pos = end
+                continue
+
+            body = bytearray()
+            pending = 0  # delta of dropped events not yet written
+            running = None  # running status in the input
+            written = None  # running status in the output
+            cursor = start
+            while cursor < end:
+                delta, cursor = _read_varlen(data, cursor)
+                event_start = cursor
+                status = data[cursor]
+                if status < 0x80:
+                    if running is None:
+                        raise MidiStreamError(f"Data byte without status at byte {cursor} of {input_path}")
+                    status = running
+                    explicit = False
+                else:
+                    cursor += 1
+                    explicit = True
+
+                if status == META:
+                    length, cursor = _read_varlen(data, cursor + 1)
+                    cursor += length
+                    is_end = data[event_start + 1] == META_END_OF_TRACK
+                elif status == SYSEX or status == SYSEX_ESCAPE:
+                    length, cursor = _read_varlen(data, cursor)
+                    cursor += length
+                    is_end = False
+                elif status < 0xF0:
+                    cursor += _message_length(status)
+                    running = status
+                    is_end = False
+                    if (status & 0xF0 == 0xB0
+                            and (controls is None or data[cursor - 2] in controls)
+                            and (channels is None or status & 0x0F in channels)
+                            and min_value <= data[cursor - 1] <= max_value):
+                        pending += delta
+                        dropped += 1
+                        continue
+                else:
+                    raise MidiStreamError(f"Unexpected status 0x{status:02X} at byte {event_start} of {input_path}")
+
+                _write_varlen(body, pending + delta)
+                pending = 0
+                if status < 0xF0:
+                    if not explicit and written != status:
+                        body.append(status)
+                    written = status
+                body += data[event_start:cursor]
+                if is_end:
+                    break
+
+            out.write(b'MTrk' + struct.pack('>I', len(body)))
+            out.write(body)
+            pos = end
+    return dropped
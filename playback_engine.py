@@ -0,0 +1,276 @@
+# playback_engine.py - Scheduler that streams pre-timed MIDI events at a live tempo ratio
+
+import threading
+import time
+
+import numpy as np
+
+from midi_events import MidiEventTable
+from tempo_map import TempoMap
+
+# All Notes Off and sustain off on every channel, sent through the event stream
+SILENCE_MESSAGES = [(0xB0 | channel, controller, 0) for channel in range(16) for controller in (123, 64)]
+
+
+class NullSink:
+    """Discards events (silent mode / headless runs)."""
+
+    def send(self, status, data1, data2):
+        pass
+
+    def all_notes_off(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class PygameMidiSink:
+    """Sends events to a pygame.midi output device."""
+
+    def __init__(self, device_id=None):
+        import pygame.midi
+
+        pygame.midi.init()
+        if device_id is None:
+            device_id = pygame.midi.get_default_output_id()
+        if device_id < 0:
+            pygame.midi.quit()
+            raise RuntimeError("No MIDI output device available")
+        self.output = pygame.midi.Output(device_id)
+
+    def send(self, status, data1, data2):
+        self.output.write_short(status, data1, data2)
+
+    def all_notes_off(self):
+        for channel in range(16):
+            self.output.write_short(0xB0 | channel, 123, 0)  # All Notes Off
+            self.output.write_short(0xB0 | channel, 64, 0)   # Sustain off
+
+    def close(self):
+        import pygame.midi
+
+        self.all_notes_off()
+        self.output.close()
+        pygame.midi.quit()
+
+
+class PlaybackEngine:
+    """
+    Emits a merged, pre-timed event stream to a sink.
+
+    Event times are seconds at the file's own tempo map. `rate` scales how
+    fast that timeline is walked (current_bpm / original_bpm) and can change
+    mid-playback. Position is computed on demand from perf_counter() and the
+    last anchor (start, resume, tempo change), and the scheduler thread sleeps
+    on a condition variable until the next event is due or it is woken by a
+    transport change.
+    """
+
+    def __init__(self, times, status, data1, data2, sink=None):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.status = np.asarray(status, dtype=np.uint8).tolist()
+        self.data1 = np.asarray(data1, dtype=np.uint8).tolist()
+        self.data2 = np.asarray(data2, dtype=np.uint8).tolist()
+        self.sink = sink or NullSink()
+        self.end_time = float(self.times[-1]) if len(self.times) else 0.0
+
+        # Controller / program / pressure / bend events, for chasing state on seek.
+        # Key identifies what each event sets: (status, controller) for CCs, status otherwise.
+        status_array = np.asarray(status, dtype=np.uint8)
+        kind = status_array & 0xF0
+        self._state_index = np.flatnonzero((kind == 0xB0) | (kind == 0xC0) | (kind == 0xD0) | (kind == 0xE0))
+        state_status = status_array[self._state_index].astype(np.int32)
+        state_data1 = np.asarray(data1, dtype=np.int32)[self._state_index]
+        self._state_key = (state_status << 8) | np.where((state_status & 0xF0) == 0xB0, state_data1, 0)
+        self._pending = []
+
+        self.rate = 1.0
+        self.next_index = 0
+        self.is_running = False
+        self.is_paused = False
+        self.finished = False
+        self._anchor_time = 0.0      # file-time position at the anchor
+        self._anchor_clock = 0.0     # perf_counter() value at the anchor
+        self.on_finished = None      # called (from the scheduler thread) at end of track
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+
+    @classmethod
+    def from_event_table(cls, events: MidiEventTable, tempo_map: TempoMap = None,
+                         sink=None, end_tick=None):
+        """Merge every track's channel messages into one time-ordered stream."""
+        if tempo_map is None:
+            tempo_map = TempoMap.from_event_table(events)
+        rows = events.channel_rows()
+        # Stable merge: by tick, then track, then original position in the track
+        rows = rows[np.lexsort((rows, events.track[rows], events.tick[rows]))]
+        status, data1, data2 = events.encode_channel_messages(rows)
+        engine = cls(tempo_map.ticks_to_seconds(events.tick[rows]), status, data1, data2, sink)
+        if end_tick is not None:
+            engine.end_time = max(engine.end_time, tempo_map.tick_to_seconds(end_tick))
+        return engine
+
+    @classmethod
+    def from_stream(cls, stream, sink=None, end_seconds=None):
+        """
+        Build from a MidiStream in one pass over its merged channel messages;
+        the file is never materialised as message objects.
+        """
+        times, status, data1, data2 = [], [], [], []
+        for seconds, message_status, message_data1, message_data2 in stream.channel_messages():
+            times.append(seconds)
+            status.append(message_status)
+            data1.append(message_data1)
+            data2.append(message_data2)
+        engine = cls(times, status, data1, data2, sink)
+        if end_seconds is not None:
+            engine.end_time = max(engine.end_time, end_seconds)
+        return engine
+
+    # ------------------------------------------------------------------
+    # Clock
+    # ------------------------------------------------------------------
+
+    def _now(self):
+        """Current position on the file timeline (seconds at original tempo)."""
+        if not self.is_running or self.is_paused:
+            return self._anchor_time
+        return self._anchor_time + (time.perf_counter() - self._anchor_clock) * self.rate
+
+    def position(self):
+        with self._lock:
+            return min(self._now(), self.end_time)
+
+    def _reanchor(self, position):
+        self._anchor_time = position
+        self._anchor_clock = time.perf_counter()
+
+    # ------------------------------------------------------------------
+    # Transport
+    # ------------------------------------------------------------------
+
+    def play(self, start=0.0):
+        """Start emitting events from `start` seconds (file time)."""
+        self.stop()
+        with self._lock:
+            self.next_index = int(np.searchsorted(self.times, start, side='left'))
+            self.finished = False
+            self.is_running = True
+            self.is_paused = False
+            self._reanchor(start)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def pause(self):
+        with self._lock:
+            if not self.is_running or self.is_paused:
+                return
+            self._anchor_time = self._now()
+            self.is_paused = True
+            # Silenced by the scheduler, after any batch it is still emitting
+            self._pending.extend(SILENCE_MESSAGES)
+            self._wakeup.notify_all()
+
+    def resume(self):
+        with self._lock:
+            if self.is_running and self.is_paused:
+                self.is_paused = False
+                self._reanchor(self._anchor_time)
+                self._wakeup.notify_all()
+
+    def stop(self):
+        with self._lock:
+            was_running = self.is_running
+            if was_running:
+                self._anchor_time = self._now()
+            self.is_running = False
+            self.is_paused = False
+            self._wakeup.notify_all()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+        self._thread = None
+        if was_running:
+            self.sink.all_notes_off()
+
+    def seek(self, position):
+        """
+        Jump to `position` seconds (file time) without stopping the scheduler.
+
+        The next event is found by binary search; sounding notes are released
+        and the controller/program/bend state in effect at the new position is
+        re-sent before any further events. The release is queued ahead of the
+        chase on the scheduler thread, so it cannot arrive after new notes.
+        """
+        position = min(max(position, 0.0), self.end_time)
+        with self._lock:
+            self.next_index = int(np.searchsorted(self.times, position, side='left'))
+            self.finished = False
+            self._reanchor(position)
+            self._pending = SILENCE_MESSAGES + self.chase_messages(self.next_index)
+            self._wakeup.notify_all()
+
+    def chase_messages(self, index):
+        """Latest state-setting message per (channel, controller) before event `index`."""
+        before = np.searchsorted(self._state_index, index, side='left')
+        keys = self._state_key[:before][::-1]
+        _, last = np.unique(keys, return_index=True)
+        events = np.sort(self._state_index[before - 1 - last])
+        return [(self.status[i], self.data1[i], self.data2[i]) for i in events]
+
+    def set_rate(self, rate):
+        """Change playback speed without restarting; takes effect immediately."""
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        with self._lock:
+            self._reanchor(self._now())
+            self.rate = rate
+            self._wakeup.notify_all()
+
+    # ------------------------------------------------------------------
+    # Scheduler
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        times = self.times
+        count = len(times)
+        while True:
+            with self._lock:
+                # Queued messages (the pause silence) are flushed before parking
+                while self.is_running and self.is_paused and not self._pending:
+                    self._wakeup.wait()
+                if not self.is_running:
+                    return
+                pending, self._pending = self._pending, []
+                start = end = self.next_index
+                done = False
+                if not self.is_paused:
+                    now = self._now()
+                    end = max(start, int(np.searchsorted(times, now, side='right')))
+                    self.next_index = end
+                    done = end >= count and now >= self.end_time
+                    if done:
+                        self._anchor_time = self.end_time
+                        self.is_running = False
+                        self.finished = True
+
+            # Emit outside the lock so a slow device never blocks transport calls
+            for message in pending:
+                self.sink.send(*message)
+            for i in range(start, end):
+                self.sink.send(self.status[i], self.data1[i], self.data2[i])
+
+            if done:
+                if self.on_finished:
+                    self.on_finished()
+                return
+
+            with self._lock:
+                # Sleep exactly until the next event (or end of track); any
+                # transport change notifies and the wait is recomputed.
+                if self.is_running and not self.is_paused:
+                    next_time = times[self.next_index] if self.next_index < count else self.end_time
+                    wait = (next_time - self._now()) / self.rate
+                    if wait > 0:
+                        self._wakeup.wait(wait)
@@ -0,0 +1,93 @@
+# processing_manifest.py - On-disk record of processed files so reruns skip unchanged inputs
+
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 1
+
+
+def file_digest(path: str, block_size: int = 1 << 20):
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def params_digest(params: dict):
+    """Stable hash of the processing parameters (including the seed)."""
+    encoded = json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ProcessingManifest:
+    """
+    JSON manifest keyed by input path.
+
+    Each entry remembers the input's content hash, the parameter hash and the
+    output it produced. A file only needs reprocessing when one of those
+    changed or the output went missing. Size and mtime are stored too so an
+    untouched file is not re-hashed on every run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION:
+                    self.entries = data.get('files', {})
+            except (OSError, ValueError) as e:
+                print(f"Warning: ignoring unreadable manifest {path}: {e}")
+
+    def _content_digest(self, midi_in: str):
+        stat = os.stat(midi_in)
+        entry = self.entries.get(os.path.abspath(midi_in))
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['content'], stat
+        return file_digest(midi_in), stat
+
+    def job_key(self, midi_in: str, params: dict):
+        """(content hash, params hash, stat) describing this input right now."""
+        content, stat = self._content_digest(midi_in)
+        return content, params_digest(params), stat
+
+    def is_current(self, midi_in: str, midi_out: str, key):
+        """True if `midi_out` was already produced from this exact input and params."""
+        content, params, _ = key
+        entry = self.entries.get(os.path.abspath(midi_in))
+        return (entry is not None
+                and entry['content'] == content
+                and entry['params'] == params
+                and entry['output'] == os.path.abspath(midi_out)
+                and os.path.exists(midi_out))
+
+    def record(self, midi_in: str, midi_out: str, key):
+        content, params, stat = key
+        entry = {
+            'content': content,
+            'params': params,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'output': os.path.abspath(midi_out),
+        }
+        path = os.path.abspath(midi_in)
+        if self.entries.get(path) != entry:
+            self.entries[path] = entry
+            self.dirty = True
+
+    def save(self):
+        """Write the manifest atomically (temp file + rename)."""
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'files': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self.dirty = False
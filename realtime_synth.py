@@ -0,0 +1,607 @@
+# realtime_synth.py - Block-based SoundFont synth for live playback, plus audio outputs that pull from it
+
+import threading
+import time
+import wave
+from collections import deque
+
+import numpy as np
+
+from midi_renderer import (timecents_to_seconds, centibels_to_gain,
+                           DRUM_CHANNEL, DRUM_BANK, MAX_RELEASE_SECONDS)
+from soundfont import (GEN_PAN, GEN_INITIAL_ATTENUATION, GEN_COARSE_TUNE, GEN_FINE_TUNE,
+                       GEN_SCALE_TUNING, GEN_ATTACK_VOL_ENV, GEN_HOLD_VOL_ENV,
+                       GEN_DECAY_VOL_ENV, GEN_SUSTAIN_VOL_ENV, GEN_RELEASE_VOL_ENV)
+
+DEFAULT_SAMPLE_RATE = 48000
+DEFAULT_BLOCK_SIZE = 128     # 2.7 ms at 48 kHz
+DEFAULT_BUFFERS = 2          # blocks queued at the device
+DEFAULT_MAX_VOICES = 64
+
+# Envelope stages; a voice steps through them in order
+ATTACK, HOLD, DECAY, SUSTAIN, RELEASE = range(5)
+
+STEAL_POLICIES = ('oldest', 'quietest')
+
+
+class VoicePool:
+    """
+    Fixed-capacity, array-backed voice storage (one array per field).
+
+    Every block renders the slots up to the highest active one as a single
+    (voices x frames) NumPy pass, so the cost per block is bounded by
+    `capacity` no matter how dense the music is. When the pool is full a new
+    note steals a slot: released voices go first, then the oldest or the
+    quietest sounding one depending on `steal`.
+    """
+
+    def __init__(self, samples, capacity: int, block_size: int, steal: str = 'oldest'):
+        if steal not in STEAL_POLICIES:
+            raise ValueError(f"Unknown steal policy {steal!r}; expected one of {STEAL_POLICIES}")
+        self.samples = samples          # int16 frames of the whole SoundFont (the sample pointers index this)
+        self.capacity = capacity
+        self.block_size = block_size
+        self.steal = steal
+        self.serial = 0
+
+        v, n = capacity, block_size
+        # Per-voice state
+        self.active = np.zeros(v, dtype=bool)
+        self.channel = np.zeros(v, dtype=np.int16)
+        self.key = np.zeros(v, dtype=np.int16)
+        self.started = np.zeros(v, dtype=np.int64)            # note-on order, for oldest-first stealing
+        self.sample_start = np.zeros(v, dtype=np.int64)       # sample pointer: first frame in `samples`
+        self.last = np.ones(v, dtype=np.float64)              # last playable frame, relative to sample_start
+        self.looping = np.zeros(v, dtype=bool)
+        self.loop_start = np.zeros(v, dtype=np.float64)
+        self.loop_length = np.ones(v, dtype=np.float64)
+        self.phase = np.zeros(v, dtype=np.float64)
+        self.step = np.zeros(v, dtype=np.float64)
+        self.gain_left = np.zeros(v, dtype=np.float32)
+        self.gain_right = np.zeros(v, dtype=np.float32)
+        self.stage = np.full(v, SUSTAIN, dtype=np.int64)
+        self.stage_pos = np.zeros(v, dtype=np.float64)        # frames spent in the current stage
+        self.stage_len = np.full(v, np.inf, dtype=np.float64)
+        self.durations = np.full((5, v), np.inf, dtype=np.float64)  # frames per stage; sustain stays inf
+        self.sustain_cb = np.zeros(v, dtype=np.float64)
+        self.release_level = np.zeros(v, dtype=np.float64)
+        self.level = np.zeros(v, dtype=np.float64)            # envelope level at the end of the last block
+
+        # Scratch, allocated once
+        self._ramp = np.arange(n, dtype=np.float64)
+        self._level_end = np.empty(v, dtype=np.float64)
+        self._work = np.empty(v, dtype=np.float64)
+        self._score = np.empty(v, dtype=np.float64)
+        self._mask = np.empty(v, dtype=bool)
+        self._mask2 = np.empty(v, dtype=bool)
+        self._pos = np.empty((v, n), dtype=np.float64)
+        self._tmp = np.empty((v, n), dtype=np.float64)
+        self._wrap = np.empty((v, n), dtype=bool)
+        self._index = np.empty((v, n), dtype=np.int64)
+        self._frames = np.empty((v, n), dtype=np.int16)
+        self._a = np.empty((v, n), dtype=np.float32)
+        self._b = np.empty((v, n), dtype=np.float32)
+
+    def active_count(self):
+        return int(np.count_nonzero(self.active))
+
+    def allocate(self):
+        """Index of a free slot, stealing one if the pool is full."""
+        if not self.active.all():
+            return int(np.argmin(self.active))
+        score = self._score
+        if self.steal == 'quietest':
+            np.add(self.gain_left, self.gain_right, out=score)
+            np.multiply(score, self.level, out=score)
+        else:
+            np.copyto(score, self.started)
+        # Voices already in release are always taken before sounding ones
+        np.equal(self.stage, RELEASE, out=self._mask)
+        np.subtract(score, 1e18, out=score, where=self._mask)
+        return int(np.argmin(score))
+
+    def start(self, slot, channel, key, sample_start, sample_end, looping, loop_start, loop_end,
+              step, gain_left, gain_right, attack, hold, decay, sustain_cb, release):
+        """Fill `slot` for a new note. Loop points and lengths are sample-relative frames."""
+        self.serial += 1
+        self.active[slot] = sample_end - sample_start > 1
+        self.channel[slot] = channel
+        self.key[slot] = key
+        self.started[slot] = self.serial
+        self.sample_start[slot] = sample_start
+        self.last[slot] = max(sample_end - sample_start - 1, 1)
+        self.looping[slot] = looping
+        self.loop_start[slot] = loop_start if looping else 0
+        self.loop_length[slot] = loop_end - loop_start if looping else 1
+        self.phase[slot] = 0.0
+        self.step[slot] = step
+        self.gain_left[slot] = gain_left
+        self.gain_right[slot] = gain_right
+        self.durations[ATTACK, slot] = attack
+        self.durations[HOLD, slot] = hold
+        self.durations[DECAY, slot] = decay
+        self.durations[RELEASE, slot] = release
+        self.sustain_cb[slot] = sustain_cb
+        self.stage[slot] = ATTACK
+        self.stage_pos[slot] = 0.0
+        self.stage_len[slot] = attack
+        self.level[slot] = 0.0
+
+    def release(self, channel, key=None):
+        """Move matching sounding voices (all keys if key is None) into their release stage."""
+        mask = self._mask
+        np.equal(self.channel, channel, out=mask)
+        np.logical_and(mask, self.active, out=mask)
+        if key is not None:
+            np.equal(self.key, key, out=self._mask2)
+            np.logical_and(mask, self._mask2, out=mask)
+        np.not_equal(self.stage, RELEASE, out=self._mask2)
+        np.logical_and(mask, self._mask2, out=mask)
+        np.copyto(self.release_level, self.level, where=mask)
+        np.copyto(self.stage, RELEASE, where=mask)
+        np.copyto(self.stage_pos, 0.0, where=mask)
+        np.copyto(self.stage_len, self.durations[RELEASE], where=mask)
+
+    def _advance_envelopes(self, n):
+        """Step every envelope by n frames and compute its level at the end of the block."""
+        stage, pos, length = self.stage, self.stage_pos, self.stage_len
+        mask, mask2, work, end = self._mask, self._mask2, self._work, self._level_end
+        np.add(pos, n, out=pos)
+
+        # Attack -> hold -> decay -> sustain; zero-length stages fall straight through
+        for _ in range(SUSTAIN):
+            np.greater_equal(pos, length, out=mask)
+            np.less(stage, SUSTAIN, out=mask2)
+            np.logical_and(mask, mask2, out=mask)
+            if not mask.any():
+                break
+            np.subtract(pos, length, out=pos, where=mask)
+            np.add(stage, 1, out=stage, where=mask)
+            np.choose(stage, self.durations, out=length)
+
+        # Sustain level, then overwrite the other stages (attack linear, decay/release in dB)
+        np.multiply(self.sustain_cb, -1.0 / 200.0, out=work)
+        np.power(10.0, work, out=end)
+
+        np.equal(stage, ATTACK, out=mask)
+        np.divide(pos, length, out=work, where=mask)
+        np.minimum(work, 1.0, out=work)
+        np.copyto(end, work, where=mask)
+
+        np.equal(stage, HOLD, out=mask)
+        np.copyto(end, 1.0, where=mask)
+
+        np.equal(stage, DECAY, out=mask)
+        np.divide(pos, length, out=work, where=mask)
+        np.minimum(work, 1.0, out=work)
+        np.multiply(work, self.sustain_cb, out=work)
+        np.multiply(work, -1.0 / 200.0, out=work)
+        np.power(10.0, work, out=work)
+        np.copyto(end, work, where=mask)
+
+        # SF2 release time is the time to fall 100 dB
+        np.equal(stage, RELEASE, out=mask)
+        np.divide(pos, length, out=work, where=mask)
+        np.multiply(work, -1000.0 / 200.0, out=work)
+        np.power(10.0, work, out=work)
+        np.multiply(work, self.release_level, out=work)
+        np.copyto(end, work, where=mask)
+
+        # Finished releases free their slot
+        np.greater_equal(pos, length, out=mask2)
+        np.logical_and(mask, mask2, out=mask)
+        np.copyto(end, 0.0, where=mask)
+        np.copyto(self.active, False, where=mask)
+
+    def render(self, left, right):
+        """Mix one block of every active voice into the `left`/`right` buffers."""
+        if not self.active.any():
+            left.fill(0)
+            right.fill(0)
+            return
+        # Only slots up to the highest active one are rendered (inactive ones have zero gain)
+        k = self.capacity - int(np.argmax(self.active[::-1]))
+        n = self.block_size
+        ramp = self._ramp
+        pos, tmp, wrap = self._pos[:k], self._tmp[:k], self._wrap[:k]
+        index, frames, a, b = self._index[:k], self._frames[:k], self._a[:k], self._b[:k]
+        step, phase = self.step[:k, None], self.phase[:k, None]
+        loop_start, loop_length = self.loop_start[:k, None], self.loop_length[:k, None]
+        last, sample_start = self.last[:k, None], self.sample_start[:k, None]
+
+        # Read positions, wrapped into the loop for looping voices
+        np.multiply(step, ramp, out=pos)
+        np.add(pos, phase, out=pos)
+        np.greater_equal(pos, loop_start, out=wrap)
+        np.logical_and(wrap, self.looping[:k, None], out=wrap)
+        np.subtract(pos, loop_start, out=tmp)
+        np.mod(tmp, loop_length, out=tmp)
+        np.add(tmp, loop_start, out=tmp)
+        np.copyto(pos, tmp, where=wrap)
+        np.minimum(pos, last, out=pos)
+
+        # Linear interpolation straight from the int16 sample pool
+        np.floor(pos, out=tmp)
+        np.subtract(pos, tmp, out=pos)                    # pos now holds the fraction
+        np.copyto(index, tmp, casting='unsafe')
+        np.add(index, sample_start, out=index)
+        np.take(self.samples, index, out=frames, mode='clip')
+        np.multiply(frames, 1.0 / 32768.0, out=a, casting='unsafe')
+        np.add(index, 1, out=index)
+        np.add(last, sample_start, out=tmp)
+        np.minimum(index, tmp, out=index, casting='unsafe')
+        np.take(self.samples, index, out=frames, mode='clip')
+        np.multiply(frames, 1.0 / 32768.0, out=b, casting='unsafe')
+        np.subtract(b, a, out=b)
+        np.multiply(b, pos, out=b, casting='unsafe')
+        np.add(a, b, out=a)
+
+        # Envelope: per-voice linear ramp from last block's level to this block's
+        self._advance_envelopes(n)
+        work = self._work[:k, None]
+        np.subtract(self._level_end[:k, None], self.level[:k, None], out=work)
+        np.multiply(work, 1.0 / n, out=work)
+        np.multiply(work, ramp, out=tmp)
+        np.add(tmp, self.level[:k, None], out=tmp)
+        np.multiply(a, tmp, out=a, casting='unsafe')
+        np.copyto(self.level, self._level_end)
+
+        np.dot(self.gain_left[:k], a, out=left)
+        np.dot(self.gain_right[:k], a, out=right)
+
+        # Advance phases; one-shot samples that ran out free their slot
+        np.multiply(self.step, n, out=self._work)
+        np.add(self.phase, self._work, out=self.phase)
+        np.greater_equal(self.phase, self.loop_start, out=self._mask)
+        np.logical_and(self._mask, self.looping, out=self._mask)
+        np.subtract(self.phase, self.loop_start, out=self._work)
+        np.mod(self._work, self.loop_length, out=self._work)
+        np.add(self._work, self.loop_start, out=self._work)
+        np.copyto(self.phase, self._work, where=self._mask)
+        np.greater_equal(self.phase, self.last, out=self._mask)
+        np.logical_not(self.looping, out=self._mask2)
+        np.logical_and(self._mask, self._mask2, out=self._mask)
+        np.copyto(self.active, False, where=self._mask)
+
+        # Silent slots contribute nothing to later blocks
+        np.logical_not(self.active, out=self._mask)
+        np.copyto(self.gain_left, 0.0, where=self._mask)
+        np.copyto(self.gain_right, 0.0, where=self._mask)
+
+
+class RealtimeSynth:
+    """
+    Pulls fixed-size stereo blocks on demand (from an audio callback or a
+    pacing thread). It doubles as a PlaybackEngine sink: send() only queues
+    the message; the next render_block() applies it.
+
+    Voices live in a VoicePool of `max_voices` slots, and every NumPy
+    operation in render_block() writes through out= into buffers allocated
+    once in __init__.
+    """
+
+    def __init__(self, soundfont, sample_rate: int = DEFAULT_SAMPLE_RATE,
+                 block_size: int = DEFAULT_BLOCK_SIZE, max_voices: int = DEFAULT_MAX_VOICES,
+                 buffers: int = DEFAULT_BUFFERS, steal: str = 'oldest'):
+        self.soundfont = soundfont
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.buffers = buffers
+        self.pool = VoicePool(soundfont.samples_int16, max_voices, block_size, steal)
+        self._events = deque()
+
+        # Channel state
+        self.program = [0] * 16
+        self.bank = [0] * 16
+        self.bank[DRUM_CHANNEL] = DRUM_BANK
+        self.volume = [100] * 16
+        self.expression = [127] * 16
+        self.pan = [64] * 16
+
+        # Latency bookkeeping (seconds from send() to the block that plays it)
+        self.max_event_latency = 0.0
+        self._latency_total = 0.0
+        self._latency_count = 0
+
+        self._left = np.empty(block_size, dtype=np.float32)
+        self._right = np.empty(block_size, dtype=np.float32)
+        self._mix = np.empty((block_size, 2), dtype=np.float32)
+
+    @property
+    def output_latency(self):
+        """Device-side latency in seconds: queued blocks times block duration."""
+        return self.block_size * self.buffers / self.sample_rate
+
+    def latency_report(self):
+        """(average, worst) end-to-end latency in seconds, including output buffering."""
+        if not self._latency_count:
+            return self.output_latency, self.output_latency
+        average = self._latency_total / self._latency_count
+        return average + self.output_latency, self.max_event_latency + self.output_latency
+
+    def prepare(self, messages):
+        """
+        Resolve voices and page in samples for every note in a merged
+        (status, data1, data2) message stream ahead of playback.
+        """
+        program = list(self.program)
+        bank = list(self.bank)
+        combos = set()
+        for status, data1, data2 in messages:
+            kind, channel = status & 0xF0, status & 0x0F
+            if kind == 0x90 and data2 > 0:
+                combos.add((bank[channel], program[channel], data1, data2))
+            elif kind == 0xC0:
+                program[channel] = data1
+            elif kind == 0xB0 and data1 == 0 and channel != DRUM_CHANNEL:
+                bank[channel] = data2
+        for bank_number, program_number, key, velocity in combos:
+            for voice in self.soundfont.voices(bank_number, program_number, key, velocity):
+                self.soundfont.sample_view(voice.start, voice.end).max(initial=0)
+
+    # ------------------------------------------------------------------
+    # Sink interface (called from the scheduler thread)
+    # ------------------------------------------------------------------
+
+    def send(self, status, data1, data2):
+        self._events.append((time.perf_counter(), status, data1, data2))
+
+    def all_notes_off(self):
+        for channel in range(16):
+            self.send(0xB0 | channel, 123, 0)
+
+    def close(self):
+        self.all_notes_off()
+
+    # ------------------------------------------------------------------
+    # Event handling (called from the audio thread at block start)
+    # ------------------------------------------------------------------
+
+    def _apply_events(self):
+        now = time.perf_counter()
+        events = self._events
+        while events:
+            sent, status, data1, data2 = events.popleft()
+            latency = now - sent
+            self._latency_total += latency
+            self._latency_count += 1
+            if latency > self.max_event_latency:
+                self.max_event_latency = latency
+
+            kind, channel = status & 0xF0, status & 0x0F
+            if kind == 0x90 and data2 > 0:
+                self._note_on(channel, data1, data2)
+            elif kind == 0x80 or kind == 0x90:
+                self.pool.release(channel, data1)
+            elif kind == 0xC0:
+                self.program[channel] = data1
+            elif kind == 0xB0:
+                if data1 == 0 and channel != DRUM_CHANNEL:
+                    self.bank[channel] = data2
+                elif data1 == 7:
+                    self.volume[channel] = data2
+                elif data1 == 10:
+                    self.pan[channel] = data2
+                elif data1 == 11:
+                    self.expression[channel] = data2
+                elif data1 in (120, 123):
+                    self.pool.release(channel)
+
+    def _note_on(self, channel, key, velocity):
+        sr = self.sample_rate
+        channel_gain = (self.volume[channel] / 127.0) ** 2 * (self.expression[channel] / 127.0) ** 2
+        velocity_gain = (velocity / 127.0) ** 2
+        channel_pan = (self.pan[channel] - 64) / 64.0 * 500.0
+
+        for voice in self.soundfont.voices(self.bank[channel], self.program[channel], key, velocity):
+            g = voice.generators
+            semitones = ((key - voice.root_key) * g[GEN_SCALE_TUNING] / 100.0
+                         + g[GEN_COARSE_TUNE] + (g[GEN_FINE_TUNE] + voice.pitch_correction) / 100.0)
+            gain = channel_gain * velocity_gain * centibels_to_gain(g[GEN_INITIAL_ATTENUATION])
+            pan = min(max(g[GEN_PAN] + channel_pan, -500.0), 500.0)
+            angle = (pan + 500.0) / 1000.0 * (np.pi / 2)
+            self.pool.start(
+                self.pool.allocate(), channel, key, voice.start, voice.end, bool(voice.looping),
+                voice.loop_start - voice.start, voice.loop_end - voice.start,
+                step=2.0 ** (semitones / 12.0) * voice.sample_rate / sr,
+                gain_left=gain * np.cos(angle), gain_right=gain * np.sin(angle),
+                attack=timecents_to_seconds(g[GEN_ATTACK_VOL_ENV]) * sr,
+                hold=timecents_to_seconds(g[GEN_HOLD_VOL_ENV]) * sr,
+                decay=timecents_to_seconds(g[GEN_DECAY_VOL_ENV]) * sr,
+                sustain_cb=min(max(g[GEN_SUSTAIN_VOL_ENV], 0), 1440),
+                release=min(timecents_to_seconds(g[GEN_RELEASE_VOL_ENV]), MAX_RELEASE_SECONDS) * sr)
+
+    # ------------------------------------------------------------------
+    # Rendering
+    # ------------------------------------------------------------------
+
+    def render_block(self, out=None):
+        """
+        Render the next block into `out` (frames x 2, float32 or int16) and
+        return it. Without `out` the internal float32 mix buffer is returned.
+        """
+        self._apply_events()
+        self.pool.render(self._left, self._right)
+
+        mix = self._mix
+        mix[:, 0] = self._left
+        mix[:, 1] = self._right
+        if out is None:
+            return mix
+        if out.dtype == np.int16:
+            np.clip(mix, -1.0, 1.0, out=mix)
+            np.multiply(mix, 32767, out=mix)
+            np.copyto(out, mix, casting='unsafe')
+        else:
+            np.copyto(out, mix)
+        return out
+
+    def active_voice_count(self):
+        return self.pool.active_count()
+
+
+# ----------------------------------------------------------------------
+# Audio outputs: each pulls blocks from the synth at the device's pace
+# ----------------------------------------------------------------------
+
+class _PacedOutput:
+    """Base for outputs without a hardware callback: a thread renders blocks in real time."""
+
+    def __init__(self, synth: RealtimeSynth, realtime: bool = True):
+        self.synth = synth
+        self.realtime = realtime
+        self._running = False
+        self._thread = None
+        self._block = np.zeros((synth.block_size, 2), dtype=np.int16)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1)
+
+    def _consume(self, block):
+        pass
+
+    def _run(self):
+        period = self.synth.block_size / self.synth.sample_rate
+        next_time = time.perf_counter()
+        while self._running:
+            self._consume(self.synth.render_block(self._block))
+            if self.realtime:
+                next_time += period
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+
+class NullAudioOutput(_PacedOutput):
+    """Renders and discards blocks (headless testing and benchmarking)."""
+
+    name = 'null'
+
+
+class WaveFileAudioOutput(_PacedOutput):
+    """Renders blocks into a 16-bit stereo WAV file."""
+
+    name = 'file'
+
+    def __init__(self, synth: RealtimeSynth, path: str, realtime: bool = True):
+        super().__init__(synth, realtime)
+        self.path = path
+        self._wave = None
+
+    def start(self):
+        self._wave = wave.open(self.path, 'wb')
+        self._wave.setnchannels(2)
+        self._wave.setsampwidth(2)
+        self._wave.setframerate(self.synth.sample_rate)
+        super().start()
+
+    def stop(self):
+        super().stop()
+        if self._wave:
+            self._wave.close()
+            self._wave = None
+
+    def _consume(self, block):
+        self._wave.writeframes(block.tobytes())
+
+
+class PygameAudioOutput:
+    """
+    Queues synth blocks on a pygame mixer channel. A small ring of Sounds is
+    allocated once; blocks are rendered straight into their sample arrays.
+    The mixer must already be initialised at the synth's rate and block size.
+    """
+
+    name = 'pygame'
+
+    def __init__(self, synth: RealtimeSynth):
+        import pygame
+        import pygame.sndarray
+
+        self.synth = synth
+        self.channel = pygame.mixer.Channel(0)
+        self.sounds = [pygame.mixer.Sound(buffer=bytes(synth.block_size * 4))
+                       for _ in range(max(synth.buffers, 2))]
+        self.arrays = [pygame.sndarray.samples(sound) for sound in self.sounds]
+        self._next = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=1)
+        self.channel.stop()
+
+    def _fill(self):
+        index = self._next
+        self.synth.render_block(self.arrays[index])
+        self._next = (index + 1) % len(self.sounds)
+        return self.sounds[index]
+
+    def _run(self):
+        period = self.synth.block_size / self.synth.sample_rate
+        self.channel.play(self._fill())
+        while self._running:
+            if self.channel.get_queue() is None:
+                self.channel.queue(self._fill())
+            time.sleep(period / 4)
+
+
+class SoundDeviceAudioOutput:
+    """True callback path through the optional `sounddevice` package."""
+
+    name = 'sounddevice'
+
+    def __init__(self, synth: RealtimeSynth):
+        import sounddevice
+
+        self.synth = synth
+        self.stream = sounddevice.OutputStream(
+            samplerate=synth.sample_rate, blocksize=synth.block_size, channels=2,
+            dtype='float32', latency='low', callback=self._callback)
+
+    def _callback(self, outdata, frames, time_info, status):
+        self.synth.render_block(outdata)
+
+    def start(self):
+        self.stream.start()
+
+    def stop(self):
+        self.stream.stop()
+
+
+def open_audio_output(synth: RealtimeSynth, kind: str = 'auto', path: str = None):
+    """
+    Create an audio output for the synth. kind: 'auto' (sounddevice, then
+    pygame, then null), 'sounddevice', 'pygame', 'file' (needs path) or 'null'.
+    """
+    if kind == 'file':
+        return WaveFileAudioOutput(synth, path)
+    if kind == 'null':
+        return NullAudioOutput(synth)
+    if kind in ('auto', 'sounddevice'):
+        try:
+            return SoundDeviceAudioOutput(synth)
+        except Exception:
+            if kind == 'sounddevice':
+                raise
+    if kind in ('auto', 'pygame'):
+        try:
+            return PygameAudioOutput(synth)
+        except Exception:
+            if kind == 'pygame':
+                raise
+    return NullAudioOutput(synth)
@@ -0,0 +1,147 @@
+# render_cache.py - Incremental audio previews: per-bar, per-channel render segments cached by content
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import numpy as np
+
+from midi_events import MidiEventTable
+from midi_renderer import NoteList, OfflineRenderer, write_wav
+from tempo_map import TempoMap
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = '.render_cache'
+
+
+def bar_ticks(events: MidiEventTable):
+    """
+    Ticks per bar from the first time signature (4/4 if there is none).
+    Segment boundaries only need to be stable between edits, so later
+    meter changes are not followed.
+    """
+    ticks = events.ticks_per_beat * 4
+    rows = events.meta_rows('time_signature')
+    if len(rows):
+        meta = events.extra[rows[np.argmin(events.tick[rows])]]
+        ticks = events.ticks_per_beat * 4 * meta.numerator // meta.denominator
+    return max(int(ticks), 1)
+
+
+class RenderCache:
+    """
+    Content-addressed store of rendered segments in front of an OfflineRenderer.
+
+    A segment is every note of one channel whose onset falls in one bar,
+    rendered (tails included) from the bar's start frame. Its key hashes the
+    synth settings plus the notes' bar-relative start frames, lengths, pitch,
+    velocity and channel state, so an edit only changes the keys of the
+    segments it touched; every other segment is loaded from disk and mixed
+    back in at its offset. Stale entries are simply never looked up again.
+    """
+
+    def __init__(self, renderer: OfflineRenderer, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.renderer = renderer
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        stat = os.stat(renderer.soundfont.path)
+        self._settings = repr((CACHE_VERSION, os.path.abspath(renderer.soundfont.path),
+                               stat.st_size, stat.st_mtime_ns, renderer.sample_rate)).encode('utf-8')
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def segments(self, notes: NoteList, ticks_per_bar: int, tempo_map: TempoMap):
+        """(channel, offset frame, note indices) per non-empty (channel, bar), in mixdown order."""
+        bars = notes.tick // ticks_per_bar
+        order = np.lexsort((np.arange(len(notes)), bars, notes.channel))
+        keys = np.stack([notes.channel[order], bars[order]], axis=1)
+        bounds = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+        result = []
+        for indices in np.split(order, bounds) if len(order) else []:
+            bar_start = tempo_map.tick_to_seconds(int(bars[indices[0]]) * ticks_per_bar)
+            offset = int(round(bar_start * self.renderer.sample_rate))
+            result.append((int(notes.channel[indices[0]]), offset, indices))
+        return result
+
+    def segment_key(self, notes: NoteList, indices, offset):
+        """SHA-256 of everything that determines a segment's audio."""
+        sr = self.renderer.sample_rate
+        digest = hashlib.sha256(self._settings)
+        starts = np.rint(notes.start[indices] * sr).astype(np.int64) - offset
+        holds = np.maximum(notes.end[indices] - notes.start[indices], 0.0)
+        for column in (starts, holds, notes.key[indices], notes.velocity[indices], notes.bank[indices],
+                       notes.program[indices], notes.volume[indices], notes.expression[indices],
+                       notes.pan[indices]):
+            digest.update(np.ascontiguousarray(column).tobytes())
+        return digest.hexdigest()
+
+    def segment_audio(self, notes: NoteList, indices, offset):
+        """Cached audio for one segment, rendering and storing it on a miss."""
+        key = self.segment_key(notes, indices, offset)
+        path = self._path(key)
+        if os.path.exists(path):
+            try:
+                audio = np.load(path)
+                self.hits += 1
+                return audio
+            except (OSError, ValueError):
+                pass  # damaged entry: render it again
+
+        self.misses += 1
+        audio = self.renderer.render_notes(notes, indices, offset=offset)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.save(f, audio)
+        os.replace(temp_path, path)
+        return audio
+
+    def render_events(self, events: MidiEventTable, tempo_map: TempoMap = None):
+        """Float32 stereo mix of the whole table, reusing every unchanged segment."""
+        if tempo_map is None:
+            tempo_map = TempoMap.from_event_table(events)
+        notes = NoteList(events, tempo_map)
+        placed = [(offset, self.segment_audio(notes, indices, offset))
+                  for _, offset, indices in self.segments(notes, bar_ticks(events), tempo_map)]
+        length = max((offset + len(audio) for offset, audio in placed), default=0)
+        mix = np.zeros((length, 2), dtype=np.float32)
+        for offset, audio in placed:
+            mix[offset:offset + len(audio)] += audio
+        return mix
+
+    def render_file(self, midi_in: str, wav_out: str):
+        """Render a .mid file to WAV through the cache. Returns the audio length in seconds."""
+        audio = self.render_events(MidiEventTable.from_path(midi_in))
+        write_wav(wav_out, audio, self.renderer.sample_rate)
+        return len(audio) / self.renderer.sample_rate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a MIDI preview, re-rendering only changed bars.")
+    parser.add_argument('midi_in')
+    parser.add_argument('wav_out')
+    parser.add_argument('--soundfont', required=True, help=".sf2 SoundFont to render with")
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args(argv)
+
+    try:
+        cache = RenderCache(OfflineRenderer(args.soundfont, args.sample_rate), args.cache_dir)
+    except (OSError, ValueError) as e:
+        print(f"Error loading SoundFont: {e}")
+        return 1
+
+    start = time.perf_counter()
+    seconds = cache.render_file(args.midi_in, args.wav_out)
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {seconds:.1f}s of audio to {args.wav_out} in {elapsed:.2f}s "
+          f"({cache.hits} segments reused, {cache.misses} rendered)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
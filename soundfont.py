@@ -0,0 +1,310 @@
+# soundfont.py - Minimal SoundFont 2 (.sf2) reader: preset/instrument zones and sample data
+
+import mmap
+import struct
+
+import numpy as np
+
+# Generator operators used by the renderer (SF2.04 section 8.1.2)
+GEN_START_OFFSET = 0
+GEN_END_OFFSET = 1
+GEN_STARTLOOP_OFFSET = 2
+GEN_ENDLOOP_OFFSET = 3
+GEN_START_COARSE_OFFSET = 4
+GEN_END_COARSE_OFFSET = 12
+GEN_PAN = 17
+GEN_ATTACK_VOL_ENV = 34
+GEN_HOLD_VOL_ENV = 35
+GEN_DECAY_VOL_ENV = 36
+GEN_SUSTAIN_VOL_ENV = 37
+GEN_RELEASE_VOL_ENV = 38
+GEN_INSTRUMENT = 41
+GEN_KEY_RANGE = 43
+GEN_VEL_RANGE = 44
+GEN_STARTLOOP_COARSE_OFFSET = 45
+GEN_INITIAL_ATTENUATION = 48
+GEN_ENDLOOP_COARSE_OFFSET = 50
+GEN_COARSE_TUNE = 51
+GEN_FINE_TUNE = 52
+GEN_SAMPLE_ID = 53
+GEN_SAMPLE_MODES = 54
+GEN_SCALE_TUNING = 56
+GEN_OVERRIDING_ROOT_KEY = 58
+
+# Instrument-level defaults for every generator the renderer reads
+GENERATOR_DEFAULTS = {
+    GEN_START_OFFSET: 0, GEN_END_OFFSET: 0,
+    GEN_STARTLOOP_OFFSET: 0, GEN_ENDLOOP_OFFSET: 0,
+    GEN_START_COARSE_OFFSET: 0, GEN_END_COARSE_OFFSET: 0,
+    GEN_STARTLOOP_COARSE_OFFSET: 0, GEN_ENDLOOP_COARSE_OFFSET: 0,
+    GEN_PAN: 0,
+    GEN_ATTACK_VOL_ENV: -12000, GEN_HOLD_VOL_ENV: -12000,
+    GEN_DECAY_VOL_ENV: -12000, GEN_SUSTAIN_VOL_ENV: 0,
+    GEN_RELEASE_VOL_ENV: -12000,
+    GEN_INITIAL_ATTENUATION: 0,
+    GEN_COARSE_TUNE: 0, GEN_FINE_TUNE: 0, GEN_SCALE_TUNING: 100,
+    GEN_SAMPLE_MODES: 0, GEN_OVERRIDING_ROOT_KEY: -1,
+}
+
+# Generators that are never summed between preset and instrument level
+_NON_ADDITIVE = {GEN_KEY_RANGE, GEN_VEL_RANGE, GEN_INSTRUMENT, GEN_SAMPLE_ID,
+                 GEN_SAMPLE_MODES, GEN_OVERRIDING_ROOT_KEY,
+                 GEN_START_OFFSET, GEN_END_OFFSET, GEN_STARTLOOP_OFFSET, GEN_ENDLOOP_OFFSET,
+                 GEN_START_COARSE_OFFSET, GEN_END_COARSE_OFFSET,
+                 GEN_STARTLOOP_COARSE_OFFSET, GEN_ENDLOOP_COARSE_OFFSET}
+
+# Generators whose amount is an unsigned word: sample / instrument indices and lo-hi byte ranges
+_UNSIGNED = {GEN_KEY_RANGE, GEN_VEL_RANGE, GEN_INSTRUMENT, GEN_SAMPLE_ID}
+
+# pdta record layouts (little endian)
+PHDR_DTYPE = np.dtype([('name', 'S20'), ('preset', '<u2'), ('bank', '<u2'), ('bag', '<u2'),
+                       ('library', '<u4'), ('genre', '<u4'), ('morphology', '<u4')])
+BAG_DTYPE = np.dtype([('gen', '<u2'), ('mod', '<u2')])
+# The amount is a signed word for most generators; 'unsigned' reads the same
+# two bytes as a word for the index and range generators
+GEN_DTYPE = np.dtype({'names': ['oper', 'amount', 'unsigned'],
+                      'formats': ['<u2', '<i2', '<u2'], 'offsets': [0, 2, 2], 'itemsize': 4})
+INST_DTYPE = np.dtype([('name', 'S20'), ('bag', '<u2')])
+SHDR_DTYPE = np.dtype([('name', 'S20'), ('start', '<u4'), ('end', '<u4'),
+                       ('loop_start', '<u4'), ('loop_end', '<u4'), ('sample_rate', '<u4'),
+                       ('original_pitch', 'u1'), ('pitch_correction', 'i1'),
+                       ('link', '<u2'), ('type', '<u2')])
+
+
+class SoundFontError(ValueError):
+    """Raised when a file is not a usable SoundFont 2 bank."""
+
+
+class Zone:
+    """One key/velocity split with its generator values."""
+
+    __slots__ = ('generators', 'key_range', 'vel_range')
+
+    def __init__(self, generators):
+        self.generators = generators
+        low_high = generators.get(GEN_KEY_RANGE)
+        self.key_range = _unpack_range(low_high)
+        self.vel_range = _unpack_range(generators.get(GEN_VEL_RANGE))
+
+    def matches(self, key, velocity):
+        return (self.key_range[0] <= key <= self.key_range[1]
+                and self.vel_range[0] <= velocity <= self.vel_range[1])
+
+
+class Voice:
+    """Everything needed to play one sample for one note."""
+
+    __slots__ = ('start', 'end', 'loop_start', 'loop_end', 'sample_rate',
+                 'root_key', 'pitch_correction', 'generators')
+
+    def __init__(self, sample, generators):
+        g = generators
+        self.start = int(sample['start']) + g[GEN_START_OFFSET] + 32768 * g[GEN_START_COARSE_OFFSET]
+        self.end = int(sample['end']) + g[GEN_END_OFFSET] + 32768 * g[GEN_END_COARSE_OFFSET]
+        self.loop_start = (int(sample['loop_start']) + g[GEN_STARTLOOP_OFFSET]
+                           + 32768 * g[GEN_STARTLOOP_COARSE_OFFSET])
+        self.loop_end = (int(sample['loop_end']) + g[GEN_ENDLOOP_OFFSET]
+                         + 32768 * g[GEN_ENDLOOP_COARSE_OFFSET])
+        self.sample_rate = int(sample['sample_rate']) or 44100
+        root = g[GEN_OVERRIDING_ROOT_KEY]
+        self.root_key = root if root >= 0 else int(sample['original_pitch'])
+        self.pitch_correction = int(sample['pitch_correction'])
+        self.generators = g
+
+    @property
+    def looping(self):
+        """Sample modes 1 and 3 loop; 3 also plays the tail after release."""
+        return self.generators[GEN_SAMPLE_MODES] & 1 and self.loop_end > self.loop_start
+
+
+class SoundFont:
+    """
+    Parsed .sf2 bank.
+
+    The file is memory-mapped: only the preset/instrument/zone index (the
+    small pdta chunk) is decoded up front. `samples_int16` is a zero-copy
+    view over the mapped smpl chunk, so sample pages are read from disk
+    only when a voice actually plays them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._voice_cache = {}
+        self._float_cache = {}
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file cannot be mapped
+            self._file.close()
+            raise SoundFontError(f"{path} is not a SoundFont 2 file (empty)")
+        try:
+            self._parse(self._map)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        """Release the mapping (views handed out earlier must be dropped first)."""
+        self.samples_int16 = None
+        self._float_cache.clear()
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # a caller still holds a sample view; the map closes when it is freed
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # RIFF parsing
+    # ------------------------------------------------------------------
+
+    def _parse(self, data):
+        if len(data) < 12 or data[:4] != b'RIFF' or data[8:12] != b'sfbk':
+            raise SoundFontError(f"{self.path} is not a SoundFont 2 file (missing RIFF/sfbk header)")
+
+        chunks = {}
+        for list_id, body_start, body_end in _iter_chunks(data, 12, len(data)):
+            if list_id != b'LIST':
+                continue
+            form = data[body_start:body_start + 4]
+            for chunk_id, start, end in _iter_chunks(data, body_start + 4, body_end):
+                chunks[(form, chunk_id)] = (start, end)
+
+        try:
+            smpl = chunks[(b'sdta', b'smpl')]
+            records = {name: chunks[(b'pdta', name)]
+                       for name in (b'phdr', b'pbag', b'pgen', b'inst', b'ibag', b'igen', b'shdr')}
+        except KeyError as e:
+            raise SoundFontError(f"{self.path} is missing the {e.args[0][1].decode()} chunk")
+
+        self.samples_int16 = np.frombuffer(data, dtype='<i2', offset=smpl[0],
+                                           count=(smpl[1] - smpl[0]) // 2)
+        self._load_index({name: data[start:end] for name, (start, end) in records.items()})
+
+    def _load_index(self, records):
+        phdr = np.frombuffer(records[b'phdr'], dtype=PHDR_DTYPE)
+        pbag = np.frombuffer(records[b'pbag'], dtype=BAG_DTYPE)
+        pgen = np.frombuffer(records[b'pgen'], dtype=GEN_DTYPE)
+        inst = np.frombuffer(records[b'inst'], dtype=INST_DTYPE)
+        ibag = np.frombuffer(records[b'ibag'], dtype=BAG_DTYPE)
+        igen = np.frombuffer(records[b'igen'], dtype=GEN_DTYPE)
+        self.sample_headers = np.frombuffer(records[b'shdr'], dtype=SHDR_DTYPE)
+
+        # Last record of each list is the terminal (EOP / EOI / EOS) entry
+        self.instruments = []
+        for i in range(len(inst) - 1):
+            zones = _read_zones(ibag, igen, inst[i]['bag'], inst[i + 1]['bag'], GEN_SAMPLE_ID)
+            self.instruments.append((inst[i]['name'].decode('latin-1').rstrip('\0'), zones))
+
+        self.presets = {}
+        for i in range(len(phdr) - 1):
+            zones = _read_zones(pbag, pgen, phdr[i]['bag'], phdr[i + 1]['bag'], GEN_INSTRUMENT)
+            key = (int(phdr[i]['bank']), int(phdr[i]['preset']))
+            self.presets[key] = (phdr[i]['name'].decode('latin-1').rstrip('\0'), zones)
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def preset_name(self, bank, program):
+        preset = self.presets.get(self._resolve_preset(bank, program))
+        return preset[0] if preset else None
+
+    def _resolve_preset(self, bank, program):
+        """Fall back to bank 0 (or the first drum kit) when a preset is missing."""
+        for key in ((bank, program), (0, program), (bank, 0), (0, 0)):
+            if key in self.presets:
+                return key
+        return next(iter(self.presets), None)
+
+    def voices(self, bank, program, key, velocity):
+        """All voices (sample + merged generators) that sound for this note."""
+        cache_key = (bank, program, key, velocity)
+        cached = self._voice_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        voices = []
+        preset_key = self._resolve_preset(bank, program)
+        if preset_key is not None:
+            _, (preset_global, preset_zones) = self.presets[preset_key]
+            for preset_zone in preset_zones:
+                if not preset_zone.matches(key, velocity):
+                    continue
+                offsets = dict(preset_global)
+                offsets.update(preset_zone.generators)
+                instrument = self.instruments[offsets[GEN_INSTRUMENT]]
+                instrument_global, instrument_zones = instrument[1]
+                for zone in instrument_zones:
+                    if not zone.matches(key, velocity):
+                        continue
+                    generators = dict(GENERATOR_DEFAULTS)
+                    generators.update(instrument_global)
+                    generators.update(zone.generators)
+                    for oper, amount in offsets.items():
+                        if oper not in _NON_ADDITIVE:
+                            generators[oper] = generators.get(oper, 0) + amount
+                    sample = self.sample_headers[generators[GEN_SAMPLE_ID]]
+                    voices.append(Voice(sample, generators))
+
+        self._voice_cache[cache_key] = voices
+        return voices
+
+    def sample_view(self, start, end):
+        """Zero-copy int16 view of sample frames [start, end)."""
+        return self.samples_int16[start:end]
+
+    def sample_data(self, start, end):
+        """
+        Sample frames [start, end) as float32. Only this range is paged in,
+        and the converted copy is kept so memory grows with what has played.
+        """
+        cached = self._float_cache.get((start, end))
+        if cached is None:
+            cached = self.samples_int16[start:end].astype(np.float32) / 32768.0
+            self._float_cache[(start, end)] = cached
+        return cached
+
+
+def _iter_chunks(data, start, end):
+    """Yield (chunk_id, body_start, body_end) for RIFF chunks in data[start:end]."""
+    pos = start
+    while pos + 8 <= end:
+        chunk_id = data[pos:pos + 4]
+        size, = struct.unpack_from('<I', data, pos + 4)
+        body_start = pos + 8
+        body_end = min(body_start + size, end)
+        yield chunk_id, body_start, body_end
+        pos = body_start + size + (size & 1)  # chunks are word aligned
+
+
+def _read_zones(bags, gens, first_bag, end_bag, terminal_oper):
+    """
+    Decode the zones of one preset or instrument.
+
+    Returns (global_generators, zones); the first zone is global when it
+    does not end with the terminal generator (instrument / sampleID).
+    """
+    global_generators = {}
+    zones = []
+    for bag in range(first_bag, end_bag):
+        generators = {}
+        for gen in gens[bags[bag]['gen']:bags[bag + 1]['gen']]:
+            oper = int(gen['oper'])
+            generators[oper] = int(gen['unsigned'] if oper in _UNSIGNED else gen['amount'])
+        if terminal_oper in generators:
+            zones.append(Zone(generators))
+        elif bag == first_bag:
+            global_generators = generators
+    return global_generators, zones
+
+
+def _unpack_range(amount):
+    if amount is None:
+        return 0, 127
+    return amount & 0xFF, (amount >> 8) & 0xFF
@@ -0,0 +1,118 @@
+# tempo_map.py - Cumulative tick <-> seconds index built from set_tempo events
+
+from bisect import bisect_right
+
+import numpy as np
+
+DEFAULT_TEMPO = 500000  # microseconds per beat (120 BPM), the MIDI default
+
+
+class TempoMap:
+    """
+    Precomputed tempo map for one MIDI file.
+
+    Every tempo change is stored with the tick it happens at and the time in
+    seconds at which that tick is reached, so converting any tick (or any
+    array of ticks) is a binary search plus one multiply.
+    """
+
+    def __init__(self, ticks_per_beat: int, changes=()):
+        """
+        changes: iterable of (tick, tempo_in_microseconds_per_beat) pairs,
+        in any order. A later change at the same tick wins.
+        """
+        self.ticks_per_beat = ticks_per_beat
+
+        tempo_at = {0: DEFAULT_TEMPO}
+        for tick, tempo in sorted(changes, key=lambda change: change[0]):
+            tempo_at[int(tick)] = int(tempo)
+
+        self.ticks = np.array(sorted(tempo_at), dtype=np.int64)
+        self.tempos = np.array([tempo_at[tick] for tick in self.ticks], dtype=np.int64)
+
+        # Seconds elapsed at the start of each tempo segment
+        seconds_per_tick = self.tempos / 1e6 / ticks_per_beat
+        segment_seconds = np.diff(self.ticks) * seconds_per_tick[:-1]
+        self.seconds = np.concatenate(([0.0], np.cumsum(segment_seconds)))
+        self._seconds_per_tick = seconds_per_tick
+        self._tick_list = self.ticks.tolist()
+        self._second_list = self.seconds.tolist()
+
+    @classmethod
+    def from_event_table(cls, events):
+        """Build from a MidiEventTable (tempo changes in every track apply)."""
+        rows = events.meta_rows('set_tempo')
+        if events.midi_type == 2:
+            # Type 2 tracks are independent songs; only the first one's tempo is global
+            rows = rows[events.track[rows] == 0]
+        changes = [(events.tick[row], events.extra[row].tempo) for row in rows]
+        return cls(events.ticks_per_beat, changes)
+
+    @classmethod
+    def from_midi_file(cls, mid):
+        """Build from a mido.MidiFile."""
+        changes = []
+        tracks = mid.tracks[:1] if mid.type == 2 else mid.tracks
+        for track in tracks:
+            tick = 0
+            for msg in track:
+                tick += msg.time
+                if msg.type == 'set_tempo':
+                    changes.append((tick, msg.tempo))
+        return cls(mid.ticks_per_beat, changes)
+
+    def __len__(self):
+        return len(self.ticks)
+
+    # ------------------------------------------------------------------
+    # Scalar lookups (bisect)
+    # ------------------------------------------------------------------
+
+    def tempo_at(self, tick):
+        """Tempo in microseconds per beat in effect at `tick`."""
+        return int(self.tempos[bisect_right(self._tick_list, tick) - 1])
+
+    def bpm_at(self, tick):
+        """Tempo in beats per minute in effect at `tick`."""
+        return 60000000 / self.tempo_at(tick)
+
+    def tick_to_seconds(self, tick):
+        """Absolute time in seconds of `tick`."""
+        segment = bisect_right(self._tick_list, tick) - 1
+        return (self._second_list[segment]
+                + (tick - self._tick_list[segment]) * self._seconds_per_tick[segment])
+
+    def seconds_to_tick(self, seconds):
+        """Tick reached at `seconds` (fractional)."""
+        segment = max(bisect_right(self._second_list, seconds) - 1, 0)
+        return (self._tick_list[segment]
+                + (seconds - self._second_list[segment]) / self._seconds_per_tick[segment])
+
+    # ------------------------------------------------------------------
+    # Vectorized lookups
+    # ------------------------------------------------------------------
+
+    def tempos_at(self, ticks):
+        """Tempo in effect at every tick of an array."""
+        segments = np.searchsorted(self.ticks, ticks, side='right') - 1
+        return self.tempos[segments]
+
+    def ticks_to_seconds(self, ticks):
+        """Absolute seconds for an array of ticks."""
+        ticks = np.asarray(ticks)
+        segments = np.searchsorted(self.ticks, ticks, side='right') - 1
+        return self.seconds[segments] + (ticks - self.ticks[segments]) * self._seconds_per_tick[segments]
+
+    def seconds_to_ticks(self, seconds):
+        """Fractional ticks for an array of absolute seconds."""
+        seconds = np.asarray(seconds, dtype=np.float64)
+        segments = np.maximum(np.searchsorted(self.seconds, seconds, side='right') - 1, 0)
+        return self.ticks[segments] + (seconds - self.seconds[segments]) / self._seconds_per_tick[segments]
+
+    def ms_to_ticks(self, ms, at_ticks):
+        """
+        Convert a duration in milliseconds to ticks using the local tempo at
+        each position in `at_ticks` (scalar or array).
+        """
+        tempos = self.tempos_at(at_ticks)
+        return ms * 1000.0 * self.ticks_per_beat / tempos
@@ -0,0 +1,30 @@
+# test_midi_events.py - Note pairing in MidiEventTable
+
+import numpy as np
+
+from midi_events import MidiEventTable, NOTE_OFF, NOTE_ON
+
+
+def stray_off_table():
+    """One key: a note-off at 0 with nothing sounding, then a note from 480 to 960."""
+    return MidiEventTable(tick=[0, 480, 960], track=[0, 0, 0], channel=[0, 0, 0],
+                          type=[NOTE_OFF, NOTE_ON, NOTE_OFF], pitch=[60, 60, 60],
+                          velocity=[0, 64, 0], extra=[None, None, None])
+
+
+def test_stray_note_off_before_first_note_on_is_left_unpaired():
+    events = stray_off_table()
+    on_rows, off_rows = events.note_pairs()
+    assert on_rows.tolist() == [1]
+    assert off_rows.tolist() == [2]
+    assert events.duration.tolist() == [-1, 480, -1]
+
+
+def test_repeated_notes_pair_first_in_first_out():
+    events = MidiEventTable(tick=[0, 100, 200, 300], track=[0] * 4, channel=[0] * 4,
+                            type=[NOTE_ON, NOTE_ON, NOTE_OFF, NOTE_OFF], pitch=[60] * 4,
+                            velocity=[64, 64, 0, 0], extra=[None] * 4)
+    on_rows, off_rows = events.note_pairs()
+    assert on_rows.tolist() == [0, 1]
+    assert off_rows.tolist() == [2, 3]
+    assert np.all(events.duration[on_rows] == 200)
@@ -0,0 +1,21 @@
+# test_midi_humanizer.py - Note-level humanization keeps notes whole and ticks valid
+
+import numpy as np
+
+from midi_events import MidiEventTable, NOTE_OFF, NOTE_ON
+from midi_humanizer import humanize_events
+
+
+def test_stray_note_off_stays_put_and_ticks_stay_non_negative():
+    for seed in range(20):
+        events = MidiEventTable(tick=[0, 480, 960], track=[0, 0, 0], channel=[0, 0, 0],
+                                type=[NOTE_OFF, NOTE_ON, NOTE_OFF], pitch=[60, 60, 60],
+                                velocity=[0, 64, 0], extra=[None, None, None])
+        humanize_events(events, timing_jitter_ms=50, velocity_jitter=8, swing=0.1,
+                        rng=np.random.default_rng(seed))
+        assert events.tick.min() >= 0
+        # The unpaired note-off is not moved
+        assert events.tick[0] == 0 and events.type[0] == NOTE_OFF
+        on_rows, off_rows = events.note_pairs()
+        assert len(on_rows) == 1
+        assert np.all(events.tick[off_rows] >= events.tick[on_rows])